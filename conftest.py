@@ -0,0 +1,12 @@
+import pytest
+
+from core.testing import TEST_SETTINGS
+
+
+@pytest.fixture(autouse=True)
+def test_settings(settings):
+    '''
+    Те же настройки, что и у manage.py test (core.testing.TestRunner).
+    '''
+    for name, value in TEST_SETTINGS.items():
+        setattr(settings, name, value)
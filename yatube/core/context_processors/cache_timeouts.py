@@ -0,0 +1,9 @@
+from django.conf import settings
+
+
+def cache_timeouts(request):
+    """Добавляет сроки жизни кэшируемых фрагментов шаблонов."""
+    return {
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
+        'post_card_cache_timeout': settings.POST_CARD_CACHE_TIMEOUT,
+    }
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+
+def apply_pragmas(cursor, pragmas):
+    '''
+    Выполняет PRAGMA из словаря {имя: значение} на соединении SQLite.
+    busy_timeout ставится первым, чтобы смена journal_mode подождала
+    чужую блокировку, а не упала с "database is locked".
+    '''
+    for name in sorted(pragmas, key=lambda name: name != 'busy_timeout'):
+        cursor.execute(f'PRAGMA {name} = {pragmas[name]}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    '''
+    Обработчик сигнала connection_created: настраивает каждое новое
+    соединение с SQLite по SQLITE_PRAGMAS.
+    '''
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, settings.SQLITE_PRAGMAS)
+
+
+def estimate_count(model, using='default'):
+    '''
+    Примерное число строк в таблице модели без COUNT(*) - из статистики
+    планировщика (sqlite_stat1 после ANALYZE, pg_class.reltuples).
+    Если статистики нет, в SQLite берётся MAX(rowid): это поиск по
+    первичному ключу, а не просмотр таблицы. None, если оценить нельзя.
+    '''
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [table],
+            )
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor != 'sqlite':
+            return None
+        try:
+            cursor.execute(
+                'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                [table],
+            )
+            row = cursor.fetchone()
+        except DatabaseError:
+            row = None
+        if row:
+            return int(row[0].split()[0])
+        cursor.execute(
+            f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}'
+        )
+        return cursor.fetchone()[0] or 0
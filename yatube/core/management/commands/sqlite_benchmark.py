@@ -0,0 +1,119 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import apply_pragmas
+
+ROWS = 10000
+
+
+def _setup(path):
+    connection = sqlite3.connect(path)
+    connection.execute(
+        'CREATE TABLE post (id INTEGER PRIMARY KEY, author INTEGER, '
+        'text TEXT, pub_date REAL)'
+    )
+    connection.execute('CREATE INDEX post_author ON post (author, id)')
+    connection.executemany(
+        'INSERT INTO post (author, text, pub_date) VALUES (?, ?, ?)',
+        [(i % 100, 'x' * 200, time.time()) for i in range(ROWS)],
+    )
+    connection.commit()
+    connection.close()
+
+
+class _Worker(threading.Thread):
+    def __init__(self, path, pragmas, persistent, write, deadline):
+        super().__init__()
+        self.path = path
+        self.pragmas = pragmas
+        self.persistent = persistent
+        self.write = write
+        self.deadline = deadline
+        self.done = 0
+        self.errors = 0
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=5)
+        if self.pragmas:
+            apply_pragmas(connection.cursor(), self.pragmas)
+        return connection
+
+    def operation(self, connection):
+        if self.write:
+            connection.execute(
+                'INSERT INTO post (author, text, pub_date) VALUES (?, ?, ?)',
+                (random.randrange(100), 'x' * 200, time.time()),
+            )
+            connection.commit()
+        else:
+            connection.execute(
+                'SELECT id, text FROM post WHERE author = ? '
+                'ORDER BY id DESC LIMIT 10', (random.randrange(100),),
+            ).fetchall()
+
+    def run(self):
+        connection = self.connect() if self.persistent else None
+        while time.monotonic() < self.deadline:
+            current = connection or self.connect()
+            try:
+                self.operation(current)
+                self.done += 1
+            except sqlite3.OperationalError:
+                self.errors += 1
+            finally:
+                if not self.persistent:
+                    current.close()
+        if connection:
+            connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite при одновременных '
+            'чтении и записи: настройки по умолчанию и новое соединение '
+            'на каждую операцию против SQLITE_PRAGMAS и постоянных '
+            'соединений. Работает на временной базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=3)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+
+    def run_profile(self, pragmas, persistent, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.sqlite3')
+            _setup(path)
+            deadline = time.monotonic() + options['seconds']
+            workers = [
+                _Worker(path, pragmas, persistent, write, deadline)
+                for write in ([False] * options['readers']
+                              + [True] * options['writers'])
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        seconds = options['seconds']
+        reads = sum(w.done for w in workers if not w.write) / seconds
+        writes = sum(w.done for w in workers if w.write) / seconds
+        errors = sum(w.errors for w in workers)
+        return reads, writes, errors
+
+    def handle(self, *args, **options):
+        profiles = (
+            ('до', {}, False),
+            ('после', settings.SQLITE_PRAGMAS, True),
+        )
+        for name, pragmas, persistent in profiles:
+            reads, writes, errors = self.run_profile(pragmas, persistent,
+                                                     options)
+            self.stdout.write(
+                f'{name}: чтений {reads:.0f}/с, записей {writes:.0f}/с, '
+                f'ошибок блокировки {errors}'
+            )
@@ -0,0 +1,47 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.signals import replicas_synced
+
+
+def sync_sqlite(source, target):
+    '''
+    Копирует базу SQLite source в target через backup API: копия
+    согласованная, даже если в основную базу в это время пишут.
+    '''
+    primary = sqlite3.connect(source)
+    replica = sqlite3.connect(target)
+    try:
+        primary.backup(replica)
+    finally:
+        replica.close()
+        primary.close()
+
+
+class Command(BaseCommand):
+    help = ('Обновляет реплики SQLite из DATABASE_REPLICAS копией основной '
+            'базы и сбрасывает кэш, который мог заполниться из отстающих '
+            'реплик. С --interval повторяет это каждые N секунд.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0)
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if 'sqlite3' not in primary['ENGINE']:
+            raise CommandError('Основная база не SQLite')
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не настроены (DB_REPLICA_NAME)')
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                sync_sqlite(primary['NAME'],
+                            settings.DATABASES[alias]['NAME'])
+            replicas_synced.send(sender=self.__class__)
+            self.stdout.write(self.style.SUCCESS('Реплики обновлены'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
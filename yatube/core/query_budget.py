@@ -0,0 +1,81 @@
+import logging
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Сколько повторяющихся запросов показывать в отчёте.
+REPORT_LIMIT = 5
+
+
+class QueryBudgetExceeded(Exception):
+    '''
+    Представление сделало больше запросов к БД, чем ему разрешено.
+    Выбрасывается только в строгом режиме (QUERY_BUDGET_STRICT).
+    '''
+
+
+def query_budget(limit):
+    '''
+    Декоратор: сколько запросов к БД может сделать представление вместе
+    с отрисовкой шаблона. Проверяет QueryBudgetMiddleware.
+    '''
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+def budget_report(request, budget, queries):
+    '''
+    Отчёт о превышении: число запросов и одинаковые запросы (без
+    параметров) по убыванию числа повторов - так видно N+1.
+    '''
+    lines = [f'{request.method} {request.get_full_path()}: '
+             f'{len(queries)} запросов к БД при бюджете {budget}']
+    repeated = [(sql, count) for sql, count
+                in Counter(queries).most_common(REPORT_LIMIT) if count > 1]
+    for sql, count in repeated:
+        lines.append(f'  {count} × {sql}')
+    return '\n'.join(lines)
+
+
+class QueryBudgetMiddleware:
+    '''
+    Считает запросы к БД во время обработки запроса и сравнивает их
+    число с бюджетом представления из декоратора query_budget. При
+    превышении пишет отчёт в лог, а в строгом режиме (тесты) выбрасывает
+    QueryBudgetExceeded. Представления без бюджета не проверяются.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.query_budget = None
+        counter = _QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        budget = request.query_budget
+        if budget is not None and len(counter.queries) > budget:
+            report = budget_report(request, budget, counter.queries)
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(report)
+            logger.warning(report)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
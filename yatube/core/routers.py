@@ -0,0 +1,79 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_state = threading.local()
+
+
+def use_primary():
+    '''
+    Все чтения текущего потока идут в основную базу: пользователь
+    недавно что-то записал или запись уже была в этом запросе.
+    '''
+    _state.use_primary = True
+
+
+class PrimaryReplicaRouter:
+    '''
+    Запись - всегда в основную базу, чтение - в случайную реплику из
+    DATABASE_REPLICAS. После записи чтения прилипают к основной базе
+    (см. ReplicaRoutingMiddleware), чтобы пользователь сразу увидел
+    свой пост или комментарий, а не отстающую копию.
+    Другие посетители могут прочитать из реплики старые строки и
+    положить их в кэш под уже новым поколением; поэтому после каждого
+    обновления реплик (сигнал core.signals.replicas_synced) кэш лент
+    сбрасывается ещё раз.
+    '''
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS:
+            return None
+        if getattr(_state, 'use_primary', False):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        use_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    '''
+    Если в запросе была запись, ставит cookie, и следующие
+    REPLICA_STICKY_SECONDS секунд запросы этого браузера читают из
+    основной базы.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = request.COOKIES.get(settings.REPLICA_STICKY_COOKIE)
+        try:
+            sticky = float(cookie or 0) > time.time()
+        except ValueError:
+            sticky = False
+        _state.use_primary = sticky
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            if _state.wrote and settings.DATABASE_REPLICAS:
+                seconds = settings.REPLICA_STICKY_SECONDS
+                response.set_cookie(settings.REPLICA_STICKY_COOKIE,
+                                    str(time.time() + seconds),
+                                    max_age=seconds, httponly=True,
+                                    samesite='Lax')
+        finally:
+            _state.use_primary = False
+            _state.wrote = False
+        return response
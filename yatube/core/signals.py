@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Реплики из DATABASE_REPLICAS обновлены копией основной базы (команда
+# sync_replica). Всё, что до этого прочитано из реплики, могло отставать.
+replicas_synced = Signal()
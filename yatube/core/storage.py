@@ -0,0 +1,59 @@
+import hashlib
+import os
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''
+    Хранилище, в котором имя файла - sha256 его содержимого:
+    "posts/small.gif" сохраняется как "posts/ab/abcd....gif".
+    Одинаковые файлы хранятся один раз: если файл с таким хэшем уже
+    есть, он не перезаписывается, а возвращается его имя. Удалять файл
+    можно только через delete_unused: запись, которая сошлётся на уже
+    существующий файл, сохраняется позже самого файла.
+    '''
+    def content_name(self, name, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        digest = sha256.hexdigest()
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        try:
+            # Файл уже есть: свежий mtime не даст delete_unused удалить
+            # его, пока запись с этим именем ещё не сохранена.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super()._save(name, content)
+        return name
+
+    def delete_unused(self, name, is_used, delay):
+        '''
+        Удаляет файл, если на него никто не ссылается (is_used() ложно)
+        и его не сохраняли последние delay секунд. Перед удалением файл
+        переименовывается: одновременное сохранение того же содержимого
+        либо запишет файл заново, либо успеет обновить mtime, и тогда
+        файл возвращается на место. Возвращает True, если файл удалён.
+        '''
+        path = self.path(name)
+        trash = path + '.deleting'
+        try:
+            if time.time() - os.stat(path).st_mtime < delay or is_used():
+                return False
+            os.replace(path, trash)
+        except FileNotFoundError:
+            return False
+        if time.time() - os.stat(trash).st_mtime < delay:
+            os.replace(trash, path)
+            return False
+        os.remove(trash)
+        return True
@@ -0,0 +1,50 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .routers import use_primary
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_TASKS_WORKERS,
+            thread_name_prefix='yatube-task',
+        )
+    return _executor
+
+
+def _run(func, args):
+    # Задача запускается после записи и должна видеть её, а реплика
+    # может отставать.
+    use_primary()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой',
+                         func.__name__)
+    finally:
+        connections.close_all()
+
+
+def defer(func, *args):
+    '''
+    Ставит ф-ию в очередь фоновых задач.
+    Задача запускается в пуле потоков только после фиксации текущей
+    транзакции, чтобы видеть записанные запросом данные.
+    Если BACKGROUND_TASKS_ENABLED выключен (отладка, тесты - см.
+    core.testing), ф-ия выполняется сразу.
+    '''
+    if not settings.BACKGROUND_TASKS_ENABLED:
+        func(*args)
+        return
+    transaction.on_commit(
+        lambda: _get_executor().submit(_run, func, args)
+    )
@@ -0,0 +1,15 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def srcset(variants, image_format):
+    '''
+    Ф-ия собирает значение атрибута srcset из уменьшенных копий картинки
+    нужного формата: "url1 320w, url2 640w".
+    '''
+    return ', '.join(
+        f'{variant.url} {variant.width}w'
+        for variant in variants if variant.format == image_format
+    )
@@ -0,0 +1,24 @@
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+# Настройки, с которыми идут тесты (manage.py test и pytest): фоновые
+# задачи выполняются сразу, чтобы тест видел их результат, а превышение
+# бюджета запросов - ошибка.
+TEST_SETTINGS = {
+    'BACKGROUND_TASKS_ENABLED': False,
+    'QUERY_BUDGET_STRICT': True,
+}
+
+
+class TestRunner(DiscoverRunner):
+    '''
+    Обычный запуск тестов Django, но с настройками TEST_SETTINGS.
+    '''
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(**TEST_SETTINGS)
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
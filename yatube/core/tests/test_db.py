@@ -0,0 +1,33 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+
+class SqlitePragmasTest(TestCase):
+    def test_pragmas_applied(self):
+        '''
+        Новое соединение с SQLite настраивается по SQLITE_PRAGMAS.
+        '''
+        expected = {
+            'synchronous': 1,
+            'busy_timeout': 5000,
+            'temp_store': 2,
+            'cache_size': -64 * 2 ** 10,
+        }
+        with connection.cursor() as cursor:
+            for pragma, value in expected.items():
+                with self.subTest(pragma=pragma):
+                    cursor.execute(f'PRAGMA {pragma}')
+                    self.assertEqual(cursor.fetchone()[0], value)
+
+    def test_benchmark_command(self):
+        '''
+        Бенчмарк печатает пропускную способность до и после настройки.
+        '''
+        out = StringIO()
+        call_command('sqlite_benchmark', seconds=0.2, readers=1, writers=1,
+                     stdout=out)
+        self.assertIn('до: чтений', out.getvalue())
+        self.assertIn('после: чтений', out.getvalue())
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.http import http_date
+
+from ..views import serve_media
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+HASHED_NAME = 'posts/ab/' + 'ab' * 32 + '.gif'
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ServeMediaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.content = bytes(range(256)) * 4
+        for name in (HASHED_NAME, 'posts/variants/1-320.jpg'):
+            path = os.path.join(TEMP_MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(cls.content)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get(self, path, **headers):
+        request = RequestFactory().get('/media/' + path, **headers)
+        return serve_media(request, path)
+
+    def test_full_file(self):
+        '''Файл отдаётся целиком с кэш-заголовками.'''
+        response = self.get(HASHED_NAME)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        plain = self.get('posts/variants/1-320.jpg')
+        self.assertNotIn('immutable', plain['Cache-Control'])
+
+    def test_range(self):
+        '''Заголовок Range отдаёт только запрошенный диапазон.'''
+        cases = {
+            'bytes=10-19': (10, 19),
+            'bytes=1000-': (1000, 1023),
+            'bytes=-5': (1019, 1023),
+            'bytes=1020-5000': (1020, 1023),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(range=header):
+                response = self.get(HASHED_NAME, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'],
+                                 f'bytes {start}-{end}/1024')
+                self.assertEqual(response['Content-Length'],
+                                 str(end - start + 1))
+                self.assertEqual(b''.join(response.streaming_content),
+                                 self.content[start:end + 1])
+
+    def test_unsatisfiable_range(self):
+        '''Диапазон за концом файла - ответ 416.'''
+        response = self.get(HASHED_NAME, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_not_modified(self):
+        '''If-Modified-Since с датой файла - ответ 304 без тела.'''
+        response = self.get(HASHED_NAME)
+        again = self.get(HASHED_NAME,
+                         HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, 304)
+        stale = self.get(HASHED_NAME, HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(stale.status_code, 200)
+
+    def test_outside_media_root(self):
+        '''Пути вне MEDIA_ROOT и каталоги не отдаются.'''
+        for path in ('../settings.py', 'posts', 'missing.gif'):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    self.get(path)
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from ..management.commands.sync_replica import sync_sqlite
+from ..routers import PrimaryReplicaRouter, ReplicaRoutingMiddleware
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def handle(self, request, write=False):
+        '''
+        Прогоняет запрос через middleware и возвращает ответ и базу,
+        из которой представление читало бы данные.
+        '''
+        routes = []
+
+        def view(request):
+            if write:
+                self.router.db_for_write(None)
+            routes.append(self.router.db_for_read(None))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return response, routes[0]
+
+    def test_reads_go_to_replica(self):
+        _, database = self.handle(self.factory.get('/'))
+        self.assertEqual(database, 'replica')
+        self.assertEqual(self.router.db_for_write(None), 'default')
+
+    def test_reads_stick_to_primary_after_write(self):
+        '''
+        После записи чтения в том же запросе и в запросах следующих
+        REPLICA_STICKY_SECONDS секунд идут в основную базу.
+        '''
+        response, database = self.handle(self.factory.post('/'), write=True)
+        self.assertEqual(database, 'default')
+        cookie = response.cookies[settings.REPLICA_STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_STICKY_COOKIE] = cookie.value
+        _, database = self.handle(request)
+        self.assertEqual(database, 'default')
+        request.COOKIES[settings.REPLICA_STICKY_COOKIE] = str(time.time() - 1)
+        _, database = self.handle(request)
+        self.assertEqual(database, 'replica')
+
+    def test_no_replicas(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            response, database = self.handle(self.factory.post('/'),
+                                             write=True)
+        self.assertIsNone(database)
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+    def test_sync_sqlite(self):
+        '''
+        sync_replica копирует основную базу SQLite в файл реплики.
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'primary.sqlite3')
+            target = os.path.join(directory, 'replica.sqlite3')
+            primary = sqlite3.connect(source)
+            primary.execute('CREATE TABLE post (text TEXT)')
+            primary.execute("INSERT INTO post VALUES ('Новый пост')")
+            primary.commit()
+            primary.close()
+            sync_sqlite(source, target)
+            replica = sqlite3.connect(target)
+            rows = replica.execute('SELECT text FROM post').fetchall()
+            replica.close()
+        self.assertEqual(rows, [('Новый пост',)])
@@ -0,0 +1,81 @@
+import shutil
+import tempfile
+
+import sorl
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+
+from ..thumbnails import (_get_many_raw, backend, generate_thumbnails,
+                          ready_thumbnails)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SorlKVStoreTest(TestCase):
+    '''
+    _get_many_raw читает key-value хранилище sorl в обход его API.
+    Тест сверяет результат с самим sorl: после обновления
+    sorl-thumbnail он покажет, что устройство хранилища изменилось.
+    '''
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.ready = default_storage.save('posts/ready.gif',
+                                          ContentFile(SMALL_GIF))
+        self.missing = default_storage.save('posts/missing.gif',
+                                            ContentFile(SMALL_GIF + b'\0'))
+        generate_thumbnails(self.ready)
+
+    def key(self, name):
+        geometry, options = settings.THUMBNAIL_PRESETS['card']
+        return backend.thumbnail_file(name, geometry, **options)
+
+    def test_pinned_version(self):
+        self.assertEqual(
+            sorl.__version__, '12.7.0',
+            'Проверьте _get_many_raw с новой версией sorl-thumbnail',
+        )
+
+    def test_matches_sorl(self):
+        '''
+        Готовая миниатюра совпадает с той, что находит sorl, а её
+        отсутствие запоминается в кэше так же, как это делает sorl.
+        '''
+        ready, missing = self.key(self.ready), self.key(self.missing)
+        keys = [add_prefix(ready.key), add_prefix(missing.key)]
+        cache.clear()
+        with self.assertNumQueries(1):
+            values = _get_many_raw(keys)
+        self.assertEqual(deserialize_image_file(values[keys[0]]).name,
+                         default.kvstore.get(ready).name)
+        self.assertIs(values[keys[1]], EMPTY_VALUE)
+        with self.assertNumQueries(0):
+            self.assertEqual(_get_many_raw(keys), values)
+            self.assertIsNone(default.kvstore.get(missing))
+
+    def test_ready_thumbnails(self):
+        thumbnails = ready_thumbnails([self.ready, self.missing], 'card')
+        self.assertEqual(thumbnails[self.ready].name,
+                         self.key(self.ready).name)
+        self.assertIsNone(thumbnails[self.missing])
@@ -0,0 +1,178 @@
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - нет на Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Форматы, которые принимаются и перекодируются в себя же.
+UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+_pool = None
+
+
+def _init_worker(memory_limit, max_pixels):
+    '''
+    Запускается в каждом процессе пула: ограничивает адресное
+    пространство процесса и число пикселей, которое Pillow согласится
+    декодировать.
+    '''
+    if resource is not None and memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    Image.MAX_IMAGE_PIXELS = max_pixels
+
+
+def _worker_max_rss_kb():
+    '''
+    Максимальный RSS процесса пула за всё время его работы, а не пик
+    одной задачи: ru_maxrss не сбрасывается между задачами.
+    '''
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _reencode(source, target, quality):
+    '''
+    Выполняется в процессе пула: декодирует картинку, поворачивает её
+    по EXIF и сохраняет в target в том же формате, но без метаданных.
+    Возвращает _worker_max_rss_kb().
+    '''
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        image_format = image.format
+        frames = getattr(image, 'n_frames', 1)
+        if frames == 1:
+            image = ImageOps.exif_transpose(image)
+        image.info.pop('exif', None)
+        options = {}
+        if image_format == 'JPEG':
+            if image.mode not in ('RGB', 'L', 'CMYK'):
+                image = image.convert('RGB')
+            options.update(quality=quality, optimize=True, progressive=True)
+        elif image_format == 'WEBP':
+            options.update(quality=quality)
+        elif image_format == 'PNG':
+            options.update(optimize=True)
+        if frames > 1:
+            options.update(save_all=True)
+        image.save(target, image_format, **options)
+    return _worker_max_rss_kb()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, а не fork: дочерний процесс не наследует память
+        # обработчика запросов, и лимит RLIMIT_AS считается от нуля.
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.UPLOAD_IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(settings.UPLOAD_IMAGE_WORKER_MEMORY,
+                      settings.UPLOAD_IMAGE_MAX_PIXELS),
+        )
+    return _pool
+
+
+def _reset_pool(terminate=False):
+    '''
+    Закрывает пул; следующая задача создаст новый. С terminate=True
+    процессы пула ещё и убиваются, чтобы зависшее декодирование не
+    занимало процесс и память.
+    '''
+    global _pool
+    if _pool is not None:
+        # Пул не даёт публичного способа остановить свои процессы.
+        processes = list((getattr(_pool, '_processes', None) or {}).values())
+        _pool.shutdown(wait=False)
+        if terminate:
+            for process in processes:
+                process.terminate()
+    _pool = None
+
+
+def validate_image_upload(upload):
+    '''
+    Проверяет загруженную картинку по заголовку, не декодируя её:
+    размер файла, формат и размеры в пикселях. ImageField к этому
+    моменту уже открыл картинку (Pillow читает только заголовок) и
+    положил её в upload.image.
+    '''
+    if upload.size > settings.UPLOAD_IMAGE_MAX_BYTES:
+        raise ValidationError(
+            'Файл больше %(limit)d МБ.',
+            code='file_too_large',
+            params={'limit': settings.UPLOAD_IMAGE_MAX_BYTES // 2 ** 20},
+        )
+    image = upload.image
+    if image.format not in UPLOAD_FORMATS:
+        raise ValidationError(
+            'Поддерживаются только картинки JPEG, PNG, GIF и WebP.',
+            code='unsupported_format',
+        )
+    width, height = image.size
+    if (max(width, height) > settings.UPLOAD_IMAGE_MAX_SIDE
+            or width * height > settings.UPLOAD_IMAGE_MAX_PIXELS):
+        raise ValidationError(
+            'Картинка слишком большая: %(width)d×%(height)d пикселей.',
+            code='image_too_large',
+            params={'width': width, 'height': height},
+        )
+
+
+def reencode_upload(upload):
+    '''
+    Перекодирует загруженную картинку в отдельном процессе с
+    ограничением памяти и возвращает новый временный файл с тем же
+    именем. Обработчик запроса картинку не декодирует, поэтому его
+    память не растёт от размера картинки. Если процесс не справился
+    за UPLOAD_IMAGE_TIMEOUT секунд, картинка отклоняется.
+    '''
+    if hasattr(upload, 'temporary_file_path'):
+        source = upload.temporary_file_path()
+    else:
+        upload.seek(0)
+        source = upload.read()
+    # Обычный UploadedFile, а не TemporaryUploadedFile: хранилище
+    # скопирует его, а временный файл удалится при закрытии.
+    target = tempfile.NamedTemporaryFile(
+        suffix=os.path.splitext(upload.name)[1],
+        dir=settings.FILE_UPLOAD_TEMP_DIR,
+    )
+    result = UploadedFile(target, upload.name, upload.content_type,
+                          charset=upload.charset)
+    try:
+        max_rss_kb = _get_pool().submit(
+            _reencode, source, target.name,
+            settings.UPLOAD_IMAGE_QUALITY,
+        ).result(timeout=settings.UPLOAD_IMAGE_TIMEOUT)
+    except Exception as error:
+        result.close()
+        if isinstance(error, (BrokenProcessPool, TimeoutError)):
+            _reset_pool(terminate=isinstance(error, TimeoutError))
+        logger.warning('Не удалось перекодировать картинку %s: %r',
+                       upload.name, error)
+        raise ValidationError(
+            'Не удалось обработать картинку.', code='image_processing',
+        )
+    result.seek(0, io.SEEK_END)
+    result.size = result.tell()
+    result.seek(0)
+    logger.info('Картинка %s перекодирована, максимальный RSS процесса '
+                'пула за время его работы %s КиБ', upload.name, max_rss_kb)
+    return result
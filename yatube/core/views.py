@@ -1,4 +1,21 @@
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified)
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+# Имя файла - хэш содержимого (картинки постов, миниатюры sorl): такой
+# файл никогда не меняется и его можно кэшировать навсегда.
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{32,64}\.\w+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
 
 
 def page_not_found(request, exception):
@@ -11,3 +28,119 @@ def csrf_failure(request, reason=''):
 
 def error_500(request):
     return render(request, 'core/500.html', {'path': request.path}, status=500)
+
+
+class FileRange:
+    '''
+    Часть открытого файла от текущей позиции длиной length байт.
+    fileno() отдаёт дескриптор самого файла, поэтому WSGI-сервер с
+    wsgi.file_wrapper (gunicorn) передаёт её через os.sendfile, читая
+    ровно Content-Length байт. Иначе файл читается блоками, но не
+    дальше конца диапазона.
+    '''
+    def __init__(self, file, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _byte_range(header, size):
+    '''
+    Разбирает заголовок Range с одним диапазоном байт. Возвращает
+    (start, end) включительно, None, если заголовок не поддерживается
+    (тогда отдаётся весь файл), или False, если диапазон вне файла.
+    '''
+    match = RANGE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    '''
+    Отдаёт файл из MEDIA_ROOT для небольших установок без nginx.
+    Файл не читается в память: FileResponse отдаёт его WSGI-серверу,
+    который может передать его через os.sendfile. Поддерживаются
+    Range (один диапазон), If-Modified-Since/If-Range и долгий
+    Cache-Control для файлов с хэшем в имени.
+    '''
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Файл не найден')
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('Файл не найден')
+    size = stat_result.st_size
+    last_modified = http_date(stat_result.st_mtime)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat_result.st_mtime, size):
+        response = HttpResponseNotModified()
+        _cache_headers(response, path, last_modified)
+        return response
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if 'HTTP_RANGE' in request.META and (
+            if_range is None
+            or parse_http_date_safe(if_range) == int(stat_result.st_mtime)):
+        byte_range = _byte_range(request.META['HTTP_RANGE'], size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(fullpath, 'rb')
+    if byte_range:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(FileRange(file, end - start + 1),
+                                status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(file)
+        response['Content-Length'] = size
+    response.block_size = settings.MEDIA_SERVE_BLOCK_SIZE
+    response['Accept-Ranges'] = 'bytes'
+    _cache_headers(response, path, last_modified)
+    return response
+
+
+def _cache_headers(response, path, last_modified):
+    response['Last-Modified'] = last_modified
+    if HASHED_NAME.search(path):
+        response['Cache-Control'] = (
+            f'public, max-age={settings.MEDIA_HASHED_MAX_AGE}, immutable'
+        )
+    else:
+        response['Cache-Control'] = f'public, max-age={settings.MEDIA_MAX_AGE}'
@@ -1,31 +1,119 @@
 from django.contrib import admin
 
-from .models import Post, Group, Follow
+from .caching import group_choices
+from .deletion import schedule_deletion
+from .models import DeletionJob, Post, Group, Follow
+from .search import fts_query, matching_posts
+from .utils import EstimatedCountPaginator
+
+
+class BackgroundDeletionMixin:
+    '''
+    Удаление из админки не запускает каскад в запросе, а ставит фоновое
+    задание (см. posts.deletion): объект сразу пропадает с сайта, а
+    зависимые строки удаляются пачками.
+    '''
+    def delete_model(self, request, obj):
+        schedule_deletion(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            schedule_deletion(obj)
+
+    def get_deleted_objects(self, objs, request):
+        '''
+        Страница подтверждения не собирает каскад: сборщик загрузил бы
+        в память все зависимые строки. Показываются только сами объекты.
+        '''
+        objs = list(objs)
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        model_count = {self.opts.verbose_name_plural: len(objs)}
+        return [str(obj) for obj in objs], model_count, perms_needed, []
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    '''
+    Общие настройки списков админки для больших таблиц: число записей
+    оценивается, а не считается через COUNT(*), и второй COUNT(*) по
+    всей таблице ("показать все N") не выполняется.
+    '''
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        '''
+        Список групп берётся из кэша: иначе каждый <select> в строке
+        списка (list_editable) делает свой запрос к таблице групп.
+        '''
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if field is not None and db_field.related_model is Group:
+            field.choices = [('', field.empty_label)] + group_choices()
+        return field
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(BackgroundDeletionMixin, LargeTableAdmin):
     '''
     Класс для настройки отображения модели Post в интерфейсе админки.
     '''
-    list_display = ('pk', 'text', 'pub_date', 'author', 'group',)
+    list_display = ('pk', 'text', 'pub_date', 'author', 'group',
+                    'is_deleted',)
+    list_select_related = ('author', 'group')
     list_editable = ('group',)
+    autocomplete_fields = ('author',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        '''
+        Поиск по полнотекстовому индексу FTS5 вместо LIKE '%...%',
+        который просматривает всю таблицу.
+        '''
+        if not fts_query(search_term):
+            return queryset, False
+        return matching_posts(queryset, search_term), False
+
+    def get_ordering(self, request):
+        '''
+        При поиске лучшие совпадения идут первыми.
+        '''
+        if request.GET.get('q', '').strip() and 'o' not in request.GET:
+            return ('search_rank',)
+        return super().get_ordering(request)
+
 
 @admin.register(Group)
-class GroupAdmin(admin.ModelAdmin):
+class GroupAdmin(BackgroundDeletionMixin, admin.ModelAdmin):
     '''
     Класс для настройки отображения модели Group в интерфейсе админки.
     '''
-    pass
+    list_display = ('pk', 'title', 'slug', 'is_deleted',)
+    search_fields = ('title',)
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     '''
     Класс для настройки отображения модели Follow в интерфейсе админки.
     '''
-    pass
+    list_display = ('pk', 'user', 'author',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    '''
+    Идущие фоновые удаления и их прогресс; только для просмотра.
+    '''
+    list_display = ('title', 'kind', 'object_id', 'processed_rows',
+                    'created',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,166 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .counters import get_user_stats
+from .models import Group, User
+
+# Ключ счётчика поколений кэша лент. Любое изменение постов, комментариев
+# или групп увеличивает счётчик, и все фрагменты со старым поколением
+# в ключе перестают использоваться.
+FEED_GENERATION_KEY = 'posts:feed_generation'
+# Поколение копий базы: растёт после каждого обновления реплик.
+REPLICA_GENERATION_KEY = 'posts:replica_generation'
+# Поколение групп: растёт при любом изменении или удалении группы.
+# Группы показываются в ленте подписок, но не меняют ленты читателей.
+GROUP_GENERATION_KEY = 'posts:group_generation'
+# Поколение ленты подписок отдельного пользователя.
+TIMELINE_GENERATION_KEY = 'posts:timeline_generation:{}'
+# Страница ленты подписок целиком: посты, навигация и рекомендации.
+FOLLOW_PAGE_KEY = 'posts:follow_page:{}:{}:{}:{}:{}'
+# Список групп для выпадающих списков: (id, название) по алфавиту.
+GROUP_CHOICES_KEY = 'posts:group_choices'
+
+
+def _generation(key):
+    '''
+    Начальное значение счётчика - текущее время в наносекундах: если
+    счётчик вытеснят из кэша, новое значение не совпадёт со старыми
+    и не поднимет из кэша устаревшие фрагменты.
+    '''
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(),
+                  timeout=settings.CACHE_GENERATION_TIMEOUT)
+        generation = cache.get(key, 0)
+    return generation
+
+
+def feed_generation():
+    '''
+    Возвращает текущее поколение кэша лент.
+    '''
+    return _generation(FEED_GENERATION_KEY)
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(),
+                  timeout=settings.CACHE_GENERATION_TIMEOUT)
+
+
+def bump_feed_generation():
+    '''
+    Увеличивает поколение кэша лент: следующий запрос отрисует
+    ленту заново.
+    '''
+    _bump(FEED_GENERATION_KEY)
+
+
+def bump_replica_generation():
+    '''
+    Вызывается после обновления реплик. Запрос, прочитавший отстающую
+    реплику сразу после записи, мог закэшировать старые строки под уже
+    новым поколением (фрагменты лент, страницы, ETag). Новое поколение
+    лент, ленты подписок и свежий список групп вытесняют такие записи.
+    '''
+    _bump(FEED_GENERATION_KEY)
+    _bump(REPLICA_GENERATION_KEY)
+    forget_group_choices()
+
+
+def timeline_generation(user_id):
+    '''
+    Возвращает поколение кэша ленты подписок пользователя.
+    '''
+    return _generation(TIMELINE_GENERATION_KEY.format(user_id))
+
+
+def follow_page_key(request):
+    '''
+    Ключ кэша страницы ленты подписок. Считается до запросов к БД:
+    пользователь, поколение его ленты, поколения групп и реплик и
+    адрес страницы с курсором.
+    '''
+    user_id = request.user.pk
+    path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return FOLLOW_PAGE_KEY.format(
+        user_id, timeline_generation(user_id),
+        _generation(GROUP_GENERATION_KEY),
+        _generation(REPLICA_GENERATION_KEY), path,
+    )
+
+
+def touch_timelines(user_ids):
+    '''
+    Сбрасывает кэш лент подписок у нескольких пользователей разом:
+    вместо incr по одному ключу записывается новое поколение через
+    set_many.
+    '''
+    generation = time.time_ns()
+    cache.set_many(
+        {TIMELINE_GENERATION_KEY.format(user_id): generation
+         for user_id in user_ids},
+        timeout=settings.CACHE_GENERATION_TIMEOUT,
+    )
+
+
+def _etag(request, *parts):
+    key = ':'.join(str(part) for part in (
+        feed_generation(), request.user.pk, request.get_full_path(), *parts
+    ))
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def feed_etag(request, *args, **kwargs):
+    '''
+    ETag для лент и страницы поста. Всё, что они показывают (посты,
+    комментарии, группы, число постов автора), меняет поколение кэша
+    лент, поэтому страницу не нужно отрисовывать, чтобы ответить 304.
+    '''
+    return _etag(request)
+
+
+def profile_etag(request, username):
+    '''
+    ETag для профиля: к поколению лент добавляются счётчики подписок,
+    от которых зависят кнопка "Подписаться" и число подписчиков.
+    '''
+    user = User.objects.filter(username=username).first()
+    if user is None:
+        return None
+    stats = get_user_stats(user)
+    return _etag(request, stats.followers_count, stats.following_count)
+
+
+def group_choices():
+    '''
+    Список групп для <select> из кэша: одна выборка на все формы, а не
+    по запросу на каждую строку списка в админке.
+    '''
+    choices = cache.get(GROUP_CHOICES_KEY)
+    if choices is None:
+        choices = list(Group.objects.filter(is_deleted=False)
+                       .order_by('title')
+                       .values_list('pk', 'title'))
+        cache.set(GROUP_CHOICES_KEY, choices,
+                  timeout=settings.CACHE_GENERATION_TIMEOUT)
+    return choices
+
+
+def forget_group_choices():
+    cache.delete(GROUP_CHOICES_KEY)
+
+
+def bump_group_generation():
+    '''
+    Вызывается после переименования, удаления или снятия постов с
+    группы: сбрасывает список групп и страницы лент подписок, где
+    могли остаться старое название или ссылка на удалённую группу.
+    '''
+    forget_group_choices()
+    _bump(GROUP_GENERATION_KEY)
@@ -0,0 +1,40 @@
+from django.core.checks import Error, Tags, register
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from . import fts
+
+
+@register(Tags.database)
+def search_triggers_check(app_configs, **kwargs):
+    '''
+    Индекс поиска обновляют триггеры на posts_post и posts_comment.
+    SQLite молча теряет их, когда миграция пересоздаёт таблицу (любое
+    AlterField/AddField с ограничениями), и поиск перестаёт видеть новые
+    тексты. Проверка запускается командами migrate и
+    check --tag database; пока есть неприменённые миграции, она
+    молчит: их применение и должно вернуть триггеры.
+    '''
+    if connection.vendor != 'sqlite':
+        return []
+    executor = MigrationExecutor(connection)
+    if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"
+        )
+        names = {name for name, in cursor.fetchall()}
+    missing = [
+        table + suffix
+        for table in fts.TABLES if table in names
+        for suffix in fts.TRIGGER_SUFFIXES if table + suffix not in names
+    ]
+    if not missing:
+        return []
+    return [Error(
+        'Нет триггеров полнотекстового поиска: ' + ', '.join(missing),
+        hint=('Таблица была пересоздана миграцией. Добавьте в неё '
+              'posts.fts.restore_triggers, как в 0016_deletion.'),
+        id='posts.E001',
+    )]
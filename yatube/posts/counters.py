@@ -0,0 +1,81 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, UserStats, User
+
+# Какая таблица и какое поле связи с пользователем стоит за каждым
+# счётчиком UserStats.
+USER_COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+
+
+def change_user_counter(user_id, field, delta):
+    '''
+    Атомарно меняет счётчик пользователя (UPDATE ... SET f = f + delta).
+    Если строки счётчиков ещё нет, она будет посчитана при первом чтении.
+    Разошедшийся с данными счётчик не уходит ниже нуля: поле
+    PositiveIntegerField, и CHECK в БД отверг бы весь UPDATE.
+    '''
+    UserStats.objects.filter(user_id=user_id).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def change_comments_counter(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=Greatest(F('comments_count') + delta, 0)
+    )
+
+
+def _count_subquery(model, field, outer='pk'):
+    counts = (model.objects.filter(**{field: OuterRef(outer)})
+              .order_by().values(field).annotate(total=Count('pk'))
+              .values('total'))
+    return Coalesce(Subquery(counts), 0)
+
+
+def recount_user(user_id):
+    '''
+    Считает счётчики пользователя заново и сохраняет их.
+    '''
+    counts = {
+        field: model.objects.filter(**{field_name: user_id}).count()
+        for field, (model, field_name) in USER_COUNTERS.items()
+    }
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id, defaults=counts
+    )
+    return stats
+
+
+def get_user_stats(user):
+    '''
+    Возвращает счётчики пользователя, при отсутствии - считает их.
+    '''
+    try:
+        return UserStats.objects.get(user=user)
+    except UserStats.DoesNotExist:
+        return recount_user(user.pk)
+
+
+def recount_all():
+    '''
+    Пересчитывает все счётчики несколькими запросами UPDATE с
+    подзапросами, без загрузки объектов в память.
+    '''
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True
+    )
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in missing],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    UserStats.objects.update(**{
+        field: _count_subquery(model, field_name, outer='user')
+        for field, (model, field_name) in USER_COUNTERS.items()
+    })
+    Post.objects.update(comments_count=_count_subquery(Comment, 'post'))
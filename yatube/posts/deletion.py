@@ -0,0 +1,249 @@
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.tasks import defer
+
+from . import counters, images, timeline
+from .caching import (bump_feed_generation, bump_group_generation,
+                      touch_timelines)
+from .models import (Comment, DeletionJob, Follow, Group, ImageVariant, Post,
+                     Suggestion, TimelineEntry, User)
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк удаляется одной транзакцией: блокировка записи в SQLite
+# держится только на время одной пачки, а не всего каскада.
+BATCH_SIZE = 500
+
+
+def _ids(queryset):
+    '''
+    Пачки id строк кверисета по возрастанию id. Каждая пачка читается
+    отдельным запросом с id > последнего, так что в памяти не больше
+    BATCH_SIZE id, а строки, удалённые предыдущей пачкой, не мешают.
+    '''
+    last = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last).order_by('pk')
+                   .values_list('pk', flat=True)[:BATCH_SIZE])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def _raw_delete(model, ids):
+    '''
+    DELETE ... WHERE id IN (...) без сборщика каскадов и сигналов:
+    зависимые строки задание удаляет раньше само, а счётчики, файлы и
+    кэш лент поправляет после пачки.
+    '''
+    queryset = model.objects.filter(pk__in=ids)
+    return queryset._raw_delete(queryset.db)
+
+
+class _Purge:
+    '''
+    Удаление объектов задания DeletionJob пачками. Каждая пачка - своя
+    короткая транзакция; после неё прогресс сохраняется в задании.
+    '''
+    def __init__(self, job):
+        self.job = job
+
+    def report(self, model, number):
+        self.job.processed_rows += number
+        DeletionJob.objects.filter(pk=self.job.pk).update(
+            processed_rows=F('processed_rows') + number
+        )
+        logger.info('Удаление %s: %s - %d, всего %d строк', self.job,
+                    model._meta.verbose_name_plural, number,
+                    self.job.processed_rows)
+
+    def delete(self, queryset, collect=None):
+        '''
+        Удаляет строки кверисета пачками. collect(ids) вызывается внутри
+        транзакции пачки до удаления и возвращает ф-ию, которая после
+        фиксации поправит счётчики, файлы и кэш лент.
+        '''
+        model = queryset.model
+        for ids in _ids(queryset):
+            with transaction.atomic():
+                cleanup = collect(ids) if collect is not None else None
+                number = _raw_delete(model, ids)
+            if cleanup is not None:
+                cleanup()
+            self.report(model, number)
+
+    def variants(self, ids):
+        names = set(ImageVariant.objects.filter(pk__in=ids)
+                    .values_list('image', flat=True))
+        return lambda: [images.release_variant(name) for name in names]
+
+    def post_children(self, post_ids):
+        '''
+        Удаляет всё, что ссылается на посты: записи в лентах,
+        комментарии и копии картинок.
+        '''
+        self.delete(TimelineEntry.objects.filter(post_id__in=post_ids))
+        self.delete(Comment.objects.filter(post_id__in=post_ids))
+        self.delete(ImageVariant.objects.filter(post_id__in=post_ids),
+                    self.variants)
+
+    def post_files(self, ids):
+        names = set(Post.objects.filter(pk__in=ids)
+                    .exclude(image='').values_list('image', flat=True))
+        return lambda: [images.release_image(name) for name in names]
+
+    def comments_elsewhere(self, ids):
+        '''
+        Комментарии удаляемого пользователя к чужим постам уменьшают
+        счётчики этих постов.
+        '''
+        posts = Counter(Comment.objects.filter(pk__in=ids)
+                        .values_list('post_id', flat=True))
+
+        def cleanup():
+            for post_id, number in posts.items():
+                counters.change_comments_counter(post_id, -number)
+                timeline.touch_post_followers(post_id)
+        return cleanup
+
+    def follows(self, ids):
+        '''
+        Подписки удаляемого пользователя уменьшают счётчики подписчиков
+        и подписок у второй стороны и сбрасывают кэш её ленты.
+        '''
+        user_id = self.job.object_id
+        pairs = list(Follow.objects.filter(pk__in=ids)
+                     .values_list('user_id', 'author_id'))
+
+        def cleanup():
+            readers = []
+            for reader_id, author_id in pairs:
+                if reader_id == user_id:
+                    counters.change_user_counter(author_id,
+                                                 'followers_count', -1)
+                else:
+                    counters.change_user_counter(reader_id,
+                                                 'following_count', -1)
+                    readers.append(reader_id)
+            touch_timelines(readers)
+        return cleanup
+
+    def run(self):
+        getattr(self, f'run_{self.job.kind}')(self.job.object_id)
+
+    def run_post(self, post_id):
+        self.post_children([post_id])
+        # Сам пост удаляется обычным delete(): сигналы поправят счётчик
+        # постов автора и освободят картинку.
+        with transaction.atomic():
+            number, _ = Post.objects.filter(pk=post_id).delete()
+        self.report(Post, number)
+
+    def run_group(self, group_id):
+        posts = Post.objects.filter(group_id=group_id)
+        for ids in _ids(posts):
+            with transaction.atomic():
+                number = Post.objects.filter(pk__in=ids).update(
+                    group=None, updated=timezone.now()
+                )
+            self.report(Post, number)
+            bump_group_generation()
+        with transaction.atomic():
+            number, _ = Group.objects.filter(pk=group_id).delete()
+        self.report(Group, number)
+
+    def run_user(self, user_id):
+        self.delete(Comment.objects.filter(author_id=user_id)
+                    .exclude(post__author_id=user_id),
+                    self.comments_elsewhere)
+        for post_ids in _ids(Post.objects.filter(author_id=user_id)):
+            self.post_children(post_ids)
+            self.delete(Post.objects.filter(pk__in=post_ids),
+                        self.post_files)
+        self.delete(Follow.objects.filter(user_id=user_id)
+                    | Follow.objects.filter(author_id=user_id),
+                    self.follows)
+        self.delete(TimelineEntry.objects.filter(user_id=user_id))
+        self.delete(Suggestion.objects.filter(user_id=user_id)
+                    | Suggestion.objects.filter(suggested_id=user_id))
+        # Оставшиеся зависимые строки (счётчики, записи журнала админки)
+        # немногочисленны и удаляются обычным каскадом.
+        with transaction.atomic():
+            number, _ = User.objects.filter(pk=user_id).delete()
+        self.report(User, number)
+
+
+def _touch_suggested(user_id):
+    '''
+    Сбрасывает кэш лент подписок тех, кому рекомендован пользователь:
+    рекомендации входят в кэш страницы ленты.
+    '''
+    touch_timelines(list(Suggestion.objects.filter(suggested_id=user_id)
+                         .values_list('user_id', flat=True)))
+
+
+def _tombstone(obj):
+    '''
+    Сразу скрывает объект с сайта и возвращает вид задания удаления.
+    Пользователь отключается (is_active=False): он не может войти, а
+    его посты и комментарии не показываются.
+    '''
+    if isinstance(obj, User):
+        User.objects.filter(pk=obj.pk).update(is_active=False)
+        obj.is_active = False
+        defer(timeline.touch_followers, obj.pk)
+        defer(_touch_suggested, obj.pk)
+        return DeletionJob.USER
+    if isinstance(obj, Group):
+        Group.objects.filter(pk=obj.pk).update(is_deleted=True)
+        obj.is_deleted = True
+        bump_group_generation()
+        return DeletionJob.GROUP
+    Post.objects.filter(pk=obj.pk).update(is_deleted=True)
+    obj.is_deleted = True
+    defer(timeline.touch_followers, obj.author_id)
+    return DeletionJob.POST
+
+
+def schedule_deletion(obj):
+    '''
+    Удаляет пользователя, группу или пост в фоне: объект пропадает с
+    сайта сразу, а он сам и всё, что от него зависит, удаляется
+    пачками задачей run_deletion. Внутри запроса каскад не выполняется
+    никогда: задача стартует в пуле фоновых задач после фиксации
+    транзакции запроса, а без фоновых задач задание ждёт команды
+    purge_deleted.
+    '''
+    with transaction.atomic():
+        kind = _tombstone(obj)
+        job, _ = DeletionJob.objects.get_or_create(
+            kind=kind, object_id=obj.pk,
+            defaults={'title': str(obj)[:200]},
+        )
+    bump_feed_generation()
+    if settings.BACKGROUND_TASKS_ENABLED:
+        defer(run_deletion, job.pk)
+    return job
+
+
+def run_deletion(job_id):
+    '''
+    Выполняет задание удаления. Прерванное задание можно запустить
+    снова: уже удалённые пачки просто не найдутся.
+    '''
+    job = DeletionJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return None
+    _Purge(job).run()
+    job.delete()
+    bump_feed_generation()
+    logger.info('Удаление %s завершено, обработано %d строк', job,
+                job.processed_rows)
+    return job
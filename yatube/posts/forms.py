@@ -1,4 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+
+from core.uploads import reencode_upload, validate_image_upload
 
 from .models import Post, Comment
 
@@ -17,6 +20,20 @@ class PostForm(forms.ModelForm):
             'image': ('Необязательная картинка к посту'),
         }
 
+    def clean_image(self):
+        '''
+        Новая картинка проверяется по заголовку и перекодируется без
+        EXIF в отдельном процессе. Уже сохранённая картинка поста при
+        редактировании не трогается. Перекодирование может идти до
+        UPLOAD_IMAGE_TIMEOUT секунд, поэтому форму проверяют вне
+        транзакции.
+        '''
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            validate_image_upload(image)
+            image = reencode_upload(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     '''
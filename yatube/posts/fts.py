@@ -0,0 +1,77 @@
+'''
+Полнотекстовые индексы FTS5 над текстами постов и комментариев для
+поиска (posts.search). Таблицы external content: текст хранится только
+в posts_post и posts_comment, индекс обновляют триггеры.
+
+SQL здесь выполняют миграции, поэтому менять его можно только вместе
+с новой миграцией, которая пересоздаст индексы.
+'''
+
+TABLES = {
+    'posts_post_fts': 'posts_post',
+    'posts_comment_fts': 'posts_comment',
+}
+
+# ВНИМАНИЕ: триггеры молча пропадают, когда SQLite пересоздаёт таблицу
+# posts_post или posts_comment (почти любое изменение её полей). Каждая
+# такая миграция должна заново создать их через restore_triggers, иначе
+# новые тексты не попадут в поиск. Пропажу ловит проверка posts.E001
+# (posts.checks).
+TRIGGERS = [
+    '''CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text);
+    END''',
+    '''CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END''',
+    '''CREATE TRIGGER {fts}_au AFTER UPDATE OF text ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text);
+    END''',
+]
+TRIGGER_SUFFIXES = ('_ai', '_ad', '_au')
+
+DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS {fts}' + suffix for suffix in TRIGGER_SUFFIXES
+]
+
+CREATE = [
+    '''CREATE VIRTUAL TABLE {fts} USING fts5(
+        text, content='{table}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )''',
+    *TRIGGERS,
+    "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+]
+
+DROP = [
+    *DROP_TRIGGERS,
+    'DROP TABLE IF EXISTS {fts}',
+]
+
+
+def execute(statements, schema_editor, tables=TABLES):
+    # FTS5 есть только в SQLite, на других СУБД поиск не работает.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for fts, table in tables.items():
+        for statement in statements:
+            schema_editor.execute(statement.format(fts=fts, table=table))
+
+
+def restore_triggers(schema_editor, tables):
+    '''
+    Заново создаёт триггеры индексов tables ({fts: таблица}) после
+    миграции, которая пересоздала таблицу.
+    '''
+    execute(DROP_TRIGGERS, schema_editor, tables)
+    execute(TRIGGERS, schema_editor, tables)
+
+
+def restore_post_triggers(apps, schema_editor):
+    '''
+    Для RunPython в миграциях, меняющих поля Post.
+    '''
+    restore_triggers(schema_editor, {'posts_post_fts': 'posts_post'})
@@ -0,0 +1,210 @@
+import base64
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from core.thumbnails import (delete_thumbnails, generate_thumbnails,
+                             ready_thumbnails)
+
+from . import timeline
+from .caching import bump_feed_generation
+from .models import ImageVariant, Post
+
+logger = logging.getLogger(__name__)
+
+# Форматы уменьшенных копий: имя в БД -> (формат Pillow, расширение,
+# имя для PIL.features.check).
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', 'webp'),
+    'jpeg': ('JPEG', 'jpg', 'jpg'),
+}
+
+
+def _variant_sizes(source_width):
+    '''
+    Ширины копий не больше ширины исходной картинки (растягивать
+    картинку смысла нет), но хотя бы одна копия создаётся всегда.
+    '''
+    ratio_width, ratio_height = settings.IMAGE_VARIANT_ASPECT
+    widths = [width for width in settings.IMAGE_VARIANT_WIDTHS
+              if width <= source_width]
+    widths = widths or [min(settings.IMAGE_VARIANT_WIDTHS)]
+    return [(width, round(width * ratio_height / ratio_width))
+            for width in widths]
+
+
+def _encode(image, pillow_format):
+    buffer = io.BytesIO()
+    options = {'quality': settings.IMAGE_VARIANT_QUALITY}
+    if pillow_format == 'JPEG':
+        options.update(optimize=True, progressive=True)
+    image.save(buffer, pillow_format, **options)
+    return buffer.getvalue()
+
+
+def make_preview(post):
+    '''
+    Крошечная (IMAGE_PREVIEW_WIDTH пикселей в ширину) копия картинки
+    поста в пропорциях карточки в виде data URI JPEG. Браузер растягивает
+    её с размытием, пока грузится настоящая картинка.
+    '''
+    ratio_width, ratio_height = settings.IMAGE_VARIANT_ASPECT
+    width = settings.IMAGE_PREVIEW_WIDTH
+    size = (width, max(1, round(width * ratio_height / ratio_width)))
+    with post.image.open('rb') as file:
+        image = Image.open(file)
+        # Для JPEG декодер сразу уменьшает картинку в 2-8 раз.
+        image.draft('RGB', size)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        preview = ImageOps.fit(image, size, Image.BILINEAR)
+    buffer = io.BytesIO()
+    preview.save(buffer, 'JPEG', quality=settings.IMAGE_PREVIEW_QUALITY)
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def _shared_preview(post):
+    return (Post.objects.filter(image=post.image.name)
+            .exclude(pk=post.pk).exclude(image_preview='')
+            .values_list('image_preview', flat=True).first())
+
+
+def _encode_variants(post):
+    with post.image.open('rb') as file:
+        source = Image.open(file)
+        source = ImageOps.exif_transpose(source).convert('RGB')
+    formats = {
+        name: spec for name, spec in VARIANT_FORMATS.items()
+        if features.check(spec[2])
+    }
+    new_variants = []
+    for width, height in _variant_sizes(source.width):
+        resized = ImageOps.fit(source, (width, height), Image.LANCZOS)
+        for name, (pillow_format, extension, _) in formats.items():
+            variant = ImageVariant(post=post, source=post.image.name,
+                                   format=name, width=width, height=height)
+            variant.image.save(
+                f'{post.pk}-{width}.{extension}',
+                ContentFile(_encode(resized, pillow_format)),
+                save=False,
+            )
+            new_variants.append(variant)
+    return new_variants
+
+
+def _shared_variants(post):
+    '''
+    Копии той же картинки (по имени в хранилище с адресацией по
+    содержимому - то есть того же содержимого) у другого поста.
+    Новые записи ссылаются на те же файлы.
+    '''
+    shared = {}
+    donors = (ImageVariant.objects.filter(source=post.image.name)
+              .exclude(post=post))
+    for donor in donors:
+        shared[donor.format, donor.width] = ImageVariant(
+            post=post, source=donor.source, format=donor.format,
+            width=donor.width, height=donor.height, image=donor.image.name,
+        )
+    return list(shared.values())
+
+
+def generate_variants(post):
+    '''
+    Создаёт копии картинки поста для srcset: каждая ширина из
+    IMAGE_VARIANT_WIDTHS в каждом поддерживаемом Pillow формате.
+    Копии обрезаются по центру до пропорций карточки. Если копии этой
+    картинки уже есть (пост правили без смены картинки), ничего не
+    делается; если они есть у другого поста с той же картинкой,
+    используются его файлы. Старые файлы удаляет сигнал удаления
+    ImageVariant, когда на них больше никто не ссылается.
+    '''
+    variants = list(post.image_variants.all())
+    if variants and all(v.source == post.image.name for v in variants):
+        return
+    new_variants = _shared_variants(post) or _encode_variants(post)
+    with transaction.atomic():
+        post.image_variants.all().delete()
+        ImageVariant.objects.bulk_create(new_variants)
+
+
+def release_image(name):
+    '''
+    Удаляет картинку поста и её миниатюры, если на неё больше не
+    ссылается ни один пост (одна картинка может быть у многих постов,
+    см. core.storage.ContentAddressedStorage). Картинку, которую
+    сохраняли меньше IMAGE_RELEASE_DELAY секунд назад, может вот-вот
+    получить новый пост: её удалит позже команда release_images.
+    Ошибка удаления не должна мешать удалению поста и только пишется
+    в лог. Возвращает True, если картинка удалена.
+    '''
+    if not name:
+        return False
+    field = Post._meta.get_field('image')
+    try:
+        deleted = field.storage.delete_unused(
+            name, Post.objects.filter(image=name).exists,
+            settings.IMAGE_RELEASE_DELAY,
+        )
+        if deleted:
+            delete_thumbnails(field.attr_class(None, field, name))
+    except Exception:
+        logger.exception('Не удалось удалить картинку %s', name)
+        return False
+    return deleted
+
+
+def release_variant(name):
+    '''
+    Удаляет файл копии картинки, если на него больше не ссылается ни
+    одна запись ImageVariant.
+    '''
+    if name and not ImageVariant.objects.filter(image=name).exists():
+        ImageVariant._meta.get_field('image').storage.delete(name)
+
+
+def attach_thumbnails(posts, preset='card'):
+    '''
+    Проставляет постам страницы атрибут thumbnail_url - адрес готовой
+    миниатюры или пустую строку. Все миниатюры ищутся одним запросом
+    к кэшу, а не отдельным поиском на каждую карточку в шаблоне.
+    '''
+    thumbnails = ready_thumbnails([post.image for post in posts], preset)
+    for post in posts:
+        thumbnail = thumbnails.get(post.image) if post.image else None
+        post.thumbnail_url = thumbnail.url if thumbnail else ''
+    return posts
+
+
+def prepare_post_images(post_id):
+    '''
+    Заранее, вне запроса, создаёт миниатюры, копии картинки поста для
+    srcset и превью, если его ещё нет, и помечает пост изменённым, чтобы
+    карточки с заглушкой перерисовались.
+    '''
+    post = (Post.objects.filter(pk=post_id)
+            .only('image', 'image_preview', 'author').first())
+    if post is None or not post.image:
+        return
+    generate_thumbnails(post.image)
+    try:
+        generate_variants(post)
+    except Exception:
+        logger.exception('Не удалось создать копии картинки поста %s',
+                         post_id)
+    changes = {'updated': timezone.now()}
+    if not post.image_preview:
+        try:
+            changes['image_preview'] = (_shared_preview(post)
+                                        or make_preview(post))
+        except Exception:
+            logger.exception('Не удалось создать превью картинки поста %s',
+                             post_id)
+    Post.objects.filter(pk=post_id).update(**changes)
+    bump_feed_generation()
+    timeline.touch_followers(post.author_id)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.deletion import run_deletion
+from posts.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = ('Выполняет ждущие и доводит до конца прерванные перезапуском '
+            'удаления пользователей, групп и постов. Без фоновых задач '
+            '(BACKGROUND_TASKS_ENABLED=False) запускается по расписанию.')
+
+    def handle(self, *args, **options):
+        for job_id in DeletionJob.objects.values_list('pk', flat=True):
+            job = run_deletion(job_id)
+            if job is not None:
+                self.stdout.write(
+                    f'{job}: обработано {job.processed_rows} строк'
+                )
+        self.stdout.write(self.style.SUCCESS('Удаления завершены'))
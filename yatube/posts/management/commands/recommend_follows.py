@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рекомендации "на кого подписаться" по графу '
+            'подписок. С --synthetic-edges N только замеряет время и '
+            'память на случайном графе из N подписок, ничего не сохраняя.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=recommendations.TOP_K)
+        parser.add_argument('--synthetic-edges', type=int, default=0)
+        parser.add_argument('--synthetic-users', type=int, default=100_000)
+
+    def handle(self, *args, **options):
+        if recommendations.np is None:
+            raise CommandError('Для рекомендаций нужен NumPy: '
+                               'pip install -r requirements-batch.txt')
+        graph = None
+        if options['synthetic_edges']:
+            graph = recommendations.synthetic_graph(
+                options['synthetic_edges'], options['synthetic_users']
+            )
+        report = recommendations.rebuild_suggestions(
+            top=options['top'], graph=graph, save=graph is None
+        )
+        self.stdout.write(
+            'Пользователей: {users}, подписок: {edges}, рекомендаций: '
+            '{suggestions}\n'
+            'Загрузка графа: {load_seconds:.2f} с, всего: '
+            '{total_seconds:.2f} с'.format(**report)
+        )
+        if report['max_rss_mb'] is not None:
+            self.stdout.write('Максимальный RSS процесса: {:.1f} МБ'.format(
+                report['max_rss_mb']
+            ))
+        self.stdout.write(self.style.SUCCESS('Рекомендации пересчитаны'))
@@ -0,0 +1,34 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from posts.images import release_image
+from posts.models import ImageVariant, Post
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки постов, на которые больше никто не '
+            'ссылается. При удалении поста свежие картинки остаются '
+            '(IMAGE_RELEASE_DELAY), поэтому команду нужно запускать по '
+            'расписанию.')
+
+    def files(self, storage, directory, skip):
+        directories, files = storage.listdir(directory)
+        for name in directories:
+            path = os.path.join(directory, name)
+            if path != skip:
+                yield from self.files(storage, path, skip)
+        for name in files:
+            yield os.path.join(directory, name)
+
+    def handle(self, *args, **options):
+        field = Post._meta.get_field('image')
+        variants = ImageVariant._meta.get_field('image').upload_to
+        released = 0
+        if field.storage.exists(field.upload_to):
+            for name in self.files(field.storage, field.upload_to.rstrip('/'),
+                                   variants.rstrip('/')):
+                released += release_image(name)
+        self.stdout.write(
+            self.style.SUCCESS(f'Удалено картинок: {released}')
+        )
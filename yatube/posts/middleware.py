@@ -0,0 +1,121 @@
+import hashlib
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import feed_generation
+
+PAGE_CACHE_KEY = 'posts:page:{}'
+PAGE_LOCK_KEY = 'posts:page_lock:{}'
+# Как часто ожидающий обработчик проверяет, не появилась ли страница.
+WAIT_STEP = 0.05
+
+
+class AnonymousPageCacheMiddleware:
+    '''
+    Кэш целых страниц для анонимных посетителей.
+    Ключ - путь со строкой запроса. Запись считается устаревшей, когда
+    истёк PAGE_CACHE_TIMEOUT или сменилось поколение кэша лент.
+    Устаревшую или отсутствующую страницу отрисовывает только один
+    обработчик (тот, кто взял блокировку). Остальные в это время
+    получают старую копию, а если её нет - ждут новую не дольше
+    PAGE_CACHE_WAIT_TIMEOUT и затем отрисовывают страницу сами, не
+    сохраняя её.
+    Кроме того, незадолго до истечения запись пересчитывается заранее
+    с вероятностью, растущей к концу срока (probabilistic early
+    expiration), чтобы популярная страница не истекала у всех сразу.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self._cacheable_request(request):
+            return self.get_response(request)
+        digest = hashlib.md5(
+            request.get_full_path().encode('utf-8')
+        ).hexdigest()
+        key = PAGE_CACHE_KEY.format(digest)
+        lock_key = PAGE_LOCK_KEY.format(digest)
+        entry = cache.get(key)
+        if entry is not None and not self._needs_refresh(entry):
+            return self._cached(entry, 'hit')
+        if not cache.add(lock_key, 1,
+                         timeout=settings.PAGE_CACHE_LOCK_TIMEOUT):
+            if entry is not None:
+                return self._cached(entry, 'stale')
+            entry = self._wait(key, lock_key)
+            if entry is not None:
+                return self._cached(entry, 'hit')
+            return self.get_response(request)
+        try:
+            generation = feed_generation()
+            started = time.monotonic()
+            response = self.get_response(request)
+            delta = time.monotonic() - started
+            if self._cacheable_response(request, response):
+                cache.set(key, {
+                    'response': response,
+                    'generation': generation,
+                    'expires': time.time() + settings.PAGE_CACHE_TIMEOUT,
+                    'delta': delta,
+                }, timeout=(settings.PAGE_CACHE_TIMEOUT
+                            + settings.PAGE_CACHE_STALE_TIMEOUT))
+                response['X-Page-Cache'] = 'miss'
+        finally:
+            cache.delete(lock_key)
+        return response
+
+    def _wait(self, key, lock_key):
+        '''
+        Ждёт, пока владелец блокировки сохранит страницу. Если он снял
+        блокировку без записи (страница не кэшируется) или не успел за
+        PAGE_CACHE_WAIT_TIMEOUT, возвращает None.
+        '''
+        deadline = time.monotonic() + settings.PAGE_CACHE_WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_STEP)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+            if cache.get(lock_key) is None:
+                return None
+        return None
+
+    def _cacheable_request(self, request):
+        return (
+            settings.PAGE_CACHE_ENABLED
+            and request.method in ('GET', 'HEAD')
+            and not request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        )
+
+    def _cacheable_response(self, request, response):
+        match = request.resolver_match
+        return (
+            request.method == 'GET'
+            and match is not None
+            and match.view_name in settings.PAGE_CACHE_VIEWS
+            and response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+        )
+
+    def _needs_refresh(self, entry):
+        '''
+        Запись нужно пересчитать, если сменилось поколение или если
+        now - delta * beta * ln(rand) >= expires, где delta - время
+        отрисовки страницы: чем дороже страница и ближе срок, тем
+        вероятнее ранний пересчёт.
+        '''
+        if entry['generation'] != feed_generation():
+            return True
+        early = (-entry['delta'] * settings.PAGE_CACHE_BETA
+                 * math.log(1.0 - random.random()))
+        return time.time() + early >= entry['expires']
+
+    def _cached(self, entry, state):
+        response = entry['response']
+        response['X-Page-Cache'] = state
+        return response
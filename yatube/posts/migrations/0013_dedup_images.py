@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:19
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_imagevariant'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imagevariant',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to='posts/variants/', verbose_name='Картинка'),
+        ),
+        migrations.AlterField(
+            model_name='imagevariant',
+            name='source',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='Исходная картинка'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+    ]
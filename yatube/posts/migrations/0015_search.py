@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from posts import fts
+
+
+def create_search(apps, schema_editor):
+    fts.execute(fts.CREATE, schema_editor)
+
+
+def drop_search(apps, schema_editor):
+    fts.execute(fts.DROP, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_image_preview'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
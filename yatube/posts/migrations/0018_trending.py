@@ -0,0 +1,55 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:41
+
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations, models
+
+from posts import fts
+
+# Значения posts.trending на момент миграции.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+HALF_LIFE = timedelta(hours=12)
+
+
+def fill_trending(apps, schema_editor):
+    '''
+    Начальная оценка: публикация и уже написанные комментарии, как
+    будто все они пришлись на момент публикации.
+    '''
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.using(schema_editor.connection.alias)
+    batch = []
+    for post in posts.only('pk', 'pub_date', 'comments_count').iterator():
+        age = (post.pub_date - EPOCH) / HALF_LIFE
+        post.trending = (math.log(1 + post.comments_count)
+                         + age * math.log(2))
+        batch.append(post)
+        if len(batch) == 500:
+            posts.bulk_update(batch, ['trending'])
+            batch = []
+    posts.bulk_update(batch, ['trending'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_suggestion'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop,
+                             fts.restore_post_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='trending',
+            field=models.FloatField(default=0, editable=False, help_text='Логарифм суммы затухающих весов событий поста, см. posts.trending', verbose_name='Оценка в тренде'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-trending', '-id'], name='post_trending_idx'),
+        ),
+        migrations.RunPython(fill_trending, migrations.RunPython.noop),
+        migrations.RunPython(fts.restore_post_triggers,
+                             migrations.RunPython.noop),
+    ]
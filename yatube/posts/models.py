@@ -4,6 +4,8 @@ from django.contrib.auth import get_user_model
 
 from django.db.models.constraints import UniqueConstraint
 
+from core.storage import ContentAddressedStorage
+
 NUMBER_OF_CHAR = 15
 
 User = get_user_model()
@@ -19,11 +21,26 @@ class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name="Название")
     slug = models.SlugField(unique=True, verbose_name="Слаг")
     description = models.TextField(verbose_name="Описание")
+    is_deleted = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Удалена',
+        help_text='Группа скрыта с сайта и удаляется в фоне',
+    )
 
     def __str__(self):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def visible(self):
+        '''
+        Посты, которые показываются на сайте: не удалённые и не от
+        удалённых или отключённых (is_active=False) пользователей.
+        '''
+        return self.filter(is_deleted=False, author__is_active=True)
+
+
 class Post(models.Model):
     '''
     Модель для создания таблицы "Post".
@@ -32,6 +49,8 @@ class Post(models.Model):
     '''
     text = models.TextField(verbose_name="Текст")
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name="Дата")
+    updated = models.DateTimeField(auto_now=True,
+                                   verbose_name="Дата изменения")
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -44,18 +63,56 @@ class Post(models.Model):
         null=True,
         on_delete=models.SET_NULL,
         related_name='posts',
+        limit_choices_to={'is_deleted': False},
         verbose_name="Группа"
     )
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
+        blank=True,
+        db_index=True,
+    )
+    image_preview = models.TextField(
         blank=True,
+        editable=False,
+        verbose_name='Превью картинки',
+        help_text='Крошечная копия картинки в виде data URI',
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число комментариев',
+    )
+    trending = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Оценка в тренде',
+        help_text='Логарифм суммы затухающих весов событий поста, '
+                  'см. posts.trending',
+    )
+    is_deleted = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Удалён',
+        help_text='Пост скрыт с сайта и удаляется в фоне',
     )
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_date_idx'),
+            models.Index(fields=['-trending', '-id'],
+                         name='post_trending_idx'),
+        ]
 
     def __str__(self):
         return self.text[:NUMBER_OF_CHAR]
@@ -82,6 +139,12 @@ class Comment(models.Model):
     created = models.DateTimeField(auto_now_add=True,
                                    verbose_name="Дата комментария")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'],
+                         name='comment_post_created_idx'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -101,3 +164,175 @@ class Follow(models.Model):
         constraints = [
             UniqueConstraint(fields=['user', 'author'], name='user_and_author')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    '''
+    Модель для создания таблицы "TimelineEntry".
+    Материализованная лента подписок: для каждого подписчика хранит
+    ссылки на посты авторов, на которых он подписан.
+    Поле "pub_date" копируется из поста, чтобы лента читалась одним
+    проходом по индексу (user, pub_date, id).
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата')
+
+    class Meta:
+        ordering = ['-pub_date', '-id']
+        constraints = [
+            UniqueConstraint(fields=['user', 'post'], name='user_and_post')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-id'],
+                         name='timeline_user_date_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    '''
+    Модель для создания таблицы "UserStats".
+    Хранит счётчики пользователя, чтобы не считать COUNT(*) на каждой
+    странице: число постов, подписчиков и подписок.
+    Счётчики обновляются сигналами, расхождения исправляет команда
+    "recount".
+    '''
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name='Число постов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Число подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Число подписок'
+    )
+
+
+class Suggestion(models.Model):
+    '''
+    Модель для создания таблицы "Suggestion".
+    Рекомендации "на кого подписаться": лучшие кандидаты для каждого
+    пользователя. Таблицу целиком пересчитывает пакетная задача
+    "recommend_follows", страницы только читают её по индексу.
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='suggestions',
+        verbose_name='Пользователь',
+    )
+    suggested = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рекомендованный автор',
+    )
+    score = models.FloatField(verbose_name='Оценка')
+
+    class Meta:
+        ordering = ['-score']
+        constraints = [
+            UniqueConstraint(fields=['user', 'suggested'],
+                             name='user_and_suggested')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-score'],
+                         name='suggestion_user_score_idx'),
+        ]
+
+
+class ImageVariant(models.Model):
+    '''
+    Модель для создания таблицы "ImageVariant".
+    Уменьшенные копии картинки поста разной ширины и формата для
+    srcset. Размеры хранятся в таблице, чтобы при отрисовке не
+    обращаться к файлам.
+    '''
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+        verbose_name='Пост',
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/variants/',
+        db_index=True,
+    )
+    source = models.CharField(max_length=255, db_index=True,
+                              verbose_name='Исходная картинка')
+    format = models.CharField(max_length=10, verbose_name='Формат')
+    width = models.PositiveIntegerField(verbose_name='Ширина')
+    height = models.PositiveIntegerField(verbose_name='Высота')
+
+    class Meta:
+        ordering = ['format', 'width']
+        constraints = [
+            UniqueConstraint(fields=['post', 'format', 'width'],
+                             name='post_format_width')
+        ]
+
+    @property
+    def url(self):
+        return self.image.url
+
+
+class DeletionJob(models.Model):
+    '''
+    Модель для создания таблицы "DeletionJob".
+    Фоновое удаление пользователя, группы или поста вместе со всем, что
+    от них зависит. Объект сразу скрывается с сайта, а строки удаляются
+    пачками; запись хранит прогресс и позволяет продолжить удаление
+    после перезапуска (команда "purge_deleted").
+    '''
+    USER = 'user'
+    GROUP = 'group'
+    POST = 'post'
+    KINDS = [
+        (USER, 'Пользователь'),
+        (GROUP, 'Группа'),
+        (POST, 'Пост'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KINDS,
+                            verbose_name='Что удаляется')
+    object_id = models.PositiveIntegerField(verbose_name='id объекта')
+    title = models.CharField(max_length=200, verbose_name='Объект')
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name='Дата запуска')
+    processed_rows = models.PositiveIntegerField(
+        default=0, verbose_name='Обработано строк'
+    )
+
+    class Meta:
+        ordering = ['created']
+        verbose_name = 'Фоновое удаление'
+        verbose_name_plural = 'Фоновые удаления'
+        constraints = [
+            UniqueConstraint(fields=['kind', 'object_id'],
+                             name='kind_and_object')
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} {self.title}'
@@ -0,0 +1,263 @@
+import itertools
+import logging
+import time
+
+from django.db import transaction
+
+from .caching import bump_feed_generation, touch_timelines
+from .models import Follow, Suggestion
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - нет на Windows
+    resource = None
+
+try:
+    import numpy as np
+except ImportError:  # Только для пакетной задачи: requirements-batch.txt
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Сколько рекомендаций хранится на пользователя и сколько показывается.
+TOP_K = 20
+SHOWN = 5
+# Вклад путей "друзья друзей" (u -> a -> c) и "похожих читателей"
+# (u -> a <- v -> c) в оценку кандидата.
+FOF_WEIGHT = 1.0
+COFOLLOW_WEIGHT = 0.5
+# Авторы, у которых подписчиков больше, не учитываются при поиске
+# похожих читателей: подписка на очень популярного автора почти ничего
+# не говорит о вкусах, а путей через него больше всего.
+HUB_FOLLOWERS = 1000
+# Сколько самых похожих читателей берётся для каждого пользователя.
+SIMILAR_USERS = 50
+# Пользователи обрабатываются пачками: не больше USER_BATCH человек и
+# примерно не больше MAX_PATHS путей в графе на пачку, чтобы память не
+# зависела от размера графа.
+USER_BATCH = 2048
+MAX_PATHS = 4_000_000
+
+
+def suggestions_for(user, limit=SHOWN):
+    '''
+    Рекомендации для пользователя одним запросом по индексу
+    (user, -score). Отключённые и удалённые авторы не показываются.
+    '''
+    if not user.is_authenticated:
+        return []
+    return list(Suggestion.objects.filter(
+        user=user, suggested__is_active=True
+    ).select_related('suggested')[:limit])
+
+
+def load_graph():
+    '''
+    Загружает граф подписок в компактные массивы: ids - настоящие id
+    пользователей по возрастанию, src и dst - номера (в ids) подписчика
+    и автора для каждой подписки, int32.
+    '''
+    pairs = (Follow.objects.order_by().values_list('user_id', 'author_id')
+             .iterator(chunk_size=10000))
+    edges = np.fromiter(itertools.chain.from_iterable(pairs),
+                        dtype=np.int64)
+    ids, index = np.unique(edges, return_inverse=True)
+    index = index.reshape(-1, 2).astype(np.int32)
+    return ids, index[:, 0], index[:, 1]
+
+
+def synthetic_graph(edges, users, seed=0):
+    '''
+    Случайный граф подписок для замеров: подписчики равномерные, авторы
+    с длинным хвостом популярности, как на живом сайте.
+    '''
+    rng = np.random.default_rng(seed)
+    src = rng.integers(0, users, edges)
+    dst = (rng.random(edges) ** 3 * users).astype(np.int64)
+    keys = np.unique(src[src != dst] * users + dst[src != dst])
+    return (np.arange(users), (keys // users).astype(np.int32),
+            (keys % users).astype(np.int32))
+
+
+def _csr(rows, cols, size):
+    '''
+    Списки смежности в формате CSR: соседи строки r - это
+    indices[indptr[r]:indptr[r + 1]].
+    '''
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, cols[order]
+
+
+def _expand(graph, rows):
+    '''
+    Перечисляет соседей всех строк rows разом, без цикла Python:
+    возвращает номер элемента rows, откуда пришёл сосед, и самих соседей.
+    '''
+    indptr, indices = graph
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    origin = np.repeat(np.arange(len(rows)), lengths)
+    offsets = (np.arange(lengths.sum())
+               - np.repeat(np.cumsum(lengths) - lengths, lengths))
+    return origin, indices[np.repeat(starts, lengths) + offsets]
+
+
+def _sum_by_key(groups, items, weights, size):
+    '''
+    Складывает веса одинаковых пар (группа, элемент): разреженная сумма
+    через np.unique по ключу group * size + item.
+    '''
+    keys, inverse = np.unique(groups * size + items, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=weights)
+    return keys // size, keys % size, totals
+
+
+def _top(groups, scores, limit):
+    '''
+    Индексы лучших limit оценок в каждой группе.
+    '''
+    order = np.lexsort((-scores, groups))
+    ranked = groups[order]
+    rank = np.arange(len(order)) - np.searchsorted(ranked, ranked)
+    return order[rank < limit]
+
+
+def _score_batch(batch, following, followers, popularity, size, top):
+    '''
+    Оценки кандидатов для пачки пользователей batch (номера в графе).
+    Друзья друзей: каждый путь u -> a -> c добавляет FOF_WEIGHT.
+    Похожие читатели: v похож на u тем сильнее, чем больше у них общих
+    не слишком популярных авторов (вес 1 / log(2 + подписчиков автора)),
+    и авторы SIMILAR_USERS самых похожих v добавляют сходство к оценке.
+    '''
+    user, author = _expand(following, batch)
+    hop, fof = _expand(following, author)
+    rows = [user[hop]]
+    candidates = [fof]
+    weights = [np.full(len(fof), FOF_WEIGHT)]
+
+    niche = popularity[author] <= HUB_FOLLOWERS
+    hop, reader = _expand(followers, author[niche])
+    reader_of = user[niche][hop]
+    shared = 1 / np.log(2 + popularity[author[niche]][hop])
+    other = reader != batch[reader_of]
+    similar_to, similar, similarity = _sum_by_key(
+        reader_of[other], reader[other], shared[other], size
+    )
+    best = _top(similar_to, similarity, SIMILAR_USERS)
+    hop, cofollow = _expand(following, similar[best])
+    rows.append(similar_to[best][hop])
+    candidates.append(cofollow)
+    weights.append(similarity[best][hop] * COFOLLOW_WEIGHT)
+
+    user_of, candidate, score = _sum_by_key(
+        np.concatenate(rows), np.concatenate(candidates),
+        np.concatenate(weights), size
+    )
+    followed = np.isin(user_of * size + candidate, user * size + author)
+    keep = ~followed & (candidate != batch[user_of])
+    user_of, candidate, score = user_of[keep], candidate[keep], score[keep]
+    best = _top(user_of, score, top)
+    return batch[user_of[best]], candidate[best], score[best]
+
+
+def compute_suggestions(src, dst, size, top=TOP_K):
+    '''
+    Считает рекомендации по графу из load_graph. Отдаёт пачки
+    (batch, users, candidates, scores): номера пользователей пачки и
+    лучшие top кандидатов для каждого из них.
+    '''
+    following = _csr(src, dst, size)
+    followers = _csr(dst, src, size)
+    out_degree = np.diff(following[0])
+    popularity = np.diff(followers[0])
+    capped = np.where(popularity <= HUB_FOLLOWERS, popularity, 0)
+    work = np.bincount(src, weights=out_degree[dst] + capped[dst],
+                       minlength=size)
+    users = np.flatnonzero(out_degree)
+    cumulative = np.cumsum(work[users])
+    start = 0
+    while start < len(users):
+        done = cumulative[start] - work[users[start]]
+        end = np.searchsorted(cumulative, done + MAX_PATHS, side='right')
+        end = min(max(end, start + 1), start + USER_BATCH)
+        batch = users[start:end]
+        yield (batch, *_score_batch(batch, following, followers,
+                                    popularity, size, top))
+        start = end
+
+
+def _store(ids, low, high, users, candidates, scores):
+    '''
+    Заменяет рекомендации пользователей с id от low до high (None - без
+    границы) одной короткой транзакцией и сбрасывает кэш их лент.
+    '''
+    stale = Suggestion.objects.all()
+    if low is not None:
+        stale = stale.filter(user_id__gte=low)
+    if high is not None:
+        stale = stale.filter(user_id__lte=high)
+    rows = [
+        Suggestion(user_id=user_id, suggested_id=suggested_id, score=score)
+        for user_id, suggested_id, score in zip(
+            ids[users].tolist(), ids[candidates].tolist(), scores.tolist()
+        )
+    ]
+    with transaction.atomic():
+        stale.delete()
+        Suggestion.objects.bulk_create(rows, batch_size=500)
+    # Рекомендации входят в кэш страницы ленты подписок.
+    touched = ids
+    if low is not None:
+        touched = touched[touched >= low]
+    if high is not None:
+        touched = touched[touched <= high]
+    touch_timelines(touched.tolist())
+    return len(rows)
+
+
+def rebuild_suggestions(top=TOP_K, graph=None, save=True):
+    '''
+    Пересчитывает рекомендации для всех пользователей. graph - готовый
+    граф (ids, src, dst) вместо загрузки из Follow, save=False - только
+    посчитать (для замеров). Возвращает отчёт о времени и памяти.
+    Память - только максимальный RSS процесса: tracemalloc замедлил бы
+    сам замеряемый расчёт.
+    '''
+    if np is None:
+        raise RuntimeError('Для рекомендаций нужен NumPy')
+    started = time.perf_counter()
+    ids, src, dst = graph if graph is not None else load_graph()
+    loaded = time.perf_counter()
+    suggestions = 0
+    low = None
+    for batch, users, candidates, scores in compute_suggestions(
+        src, dst, len(ids), top
+    ):
+        if save:
+            last = batch[-1] == len(ids) - 1
+            high = None if last else int(ids[batch[-1]])
+            suggestions += _store(ids, low, high, users, candidates, scores)
+            low = None if high is None else high + 1
+        else:
+            suggestions += len(users)
+    if save:
+        if low is not None or not len(src):
+            _store(ids, low, None, *[np.zeros(0, dtype=np.int64)] * 3)
+        bump_feed_generation()
+    report = {
+        'users': len(ids),
+        'edges': len(src),
+        'suggestions': suggestions,
+        'load_seconds': loaded - started,
+        'total_seconds': time.perf_counter() - started,
+        'max_rss_mb': None,
+    }
+    if resource is not None:
+        report['max_rss_mb'] = resource.getrusage(
+            resource.RUSAGE_SELF
+        ).ru_maxrss / 1024
+    logger.info('Рекомендации пересчитаны: %s', report)
+    return report
@@ -0,0 +1,164 @@
+import base64
+import json
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post, User
+from .utils import MAX_INTEGER
+
+# Сколько слов запроса учитывается и сколько слов в сниппете.
+MAX_WORDS = 8
+SNIPPET_WORDS = 16
+# Маркеры начала и конца совпадения в сниппете: сниппет сначала
+# экранируется, а потом маркеры заменяются на <mark>.
+MARK_START = '\x02'
+MARK_END = '\x03'
+WORD = re.compile(r'\w+')
+
+# Совпадения в постах и комментариях, по одной строке на пост: лучший
+# (наименьший) bm25 и сниппет того текста, где совпадение лучше.
+HITS_SQL = f'''
+    SELECT post_id, MIN(rank) AS rank, snippet FROM (
+        SELECT rowid AS post_id, bm25(posts_post_fts) AS rank,
+               snippet(posts_post_fts, 0, %s, %s, '…', {SNIPPET_WORDS})
+                   AS snippet
+        FROM posts_post_fts WHERE posts_post_fts MATCH %s
+        UNION ALL
+        SELECT comment.post_id, bm25(posts_comment_fts),
+               snippet(posts_comment_fts, 0, %s, %s, '…', {SNIPPET_WORDS})
+        FROM posts_comment_fts
+        JOIN posts_comment AS comment ON comment.id = posts_comment_fts.rowid
+        WHERE posts_comment_fts MATCH %s
+    ) GROUP BY post_id
+'''
+
+# Только видимые посты (как Post.objects.visible()). Условие стоит в
+# самом запросе до LIMIT, иначе скрытые посты съедали бы место на
+# странице.
+VISIBLE_HITS_SQL = f'''
+    SELECT hits.post_id AS post_id, hits.rank AS rank, hits.snippet AS snippet
+    FROM ({HITS_SQL}) AS hits
+    JOIN {Post._meta.db_table} AS post ON post.id = hits.post_id
+    JOIN {User._meta.db_table} AS author ON author.id = post.author_id
+    WHERE NOT post.is_deleted AND author.is_active
+'''
+
+
+def fts_query(text):
+    '''
+    Строка из поля поиска -> запрос FTS5. Берутся только слова (символы
+    синтаксиса FTS5 отбрасываются), каждое ищется как префикс, нужны
+    все слова сразу.
+    '''
+    words = WORD.findall(text)[:MAX_WORDS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def encode_cursor(values):
+    token = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(token).decode('ascii')
+
+
+def decode_cursor(token):
+    '''
+    Курсор (rank, post_id, номер страницы) или None, если он испорчен.
+    '''
+    try:
+        rank, post_id, number = json.loads(base64.urlsafe_b64decode(
+            token.encode('ascii')
+        ))
+        post_id = int(post_id)
+        if abs(post_id) >= MAX_INTEGER:
+            return None
+        return float(rank), post_id, int(number)
+    except (ValueError, TypeError, OverflowError, UnicodeError):
+        return None
+
+
+def _highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def search_posts(text, per_page, after=None, before=None):
+    '''
+    Страница результатов поиска по постам и комментариям, лучшие
+    совпадения первыми. Страницы листаются по курсору (rank, post_id)
+    без OFFSET. Возвращает словарь: посты с атрибутом search_snippet,
+    номер страницы и курсоры соседних страниц.
+    '''
+    result = {'posts': [], 'number': 1,
+              'next_cursor': None, 'previous_cursor': None}
+    query = fts_query(text)
+    if not query or connection.vendor != 'sqlite':
+        return result
+    cursor = decode_cursor(after or before or '')
+    params = [MARK_START, MARK_END, query] * 2
+    sql = f'SELECT post_id, rank, snippet FROM ({VISIBLE_HITS_SQL})'
+    older = before is None
+    if cursor:
+        rank, post_id, number = cursor
+        sql += f' WHERE (rank, post_id) {">" if older else "<"} (%s, %s)'
+        params += [rank, post_id]
+        result['number'] = number
+    direction = 'ASC' if older else 'DESC'
+    sql += f' ORDER BY rank {direction}, post_id {direction} LIMIT %s'
+    params.append(per_page + 1)
+    with connection.cursor() as db:
+        db.execute(sql, params)
+        rows = db.fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not older:
+        rows.reverse()
+    if not rows:
+        return result
+    number = result['number']
+    has_next = has_more if older else True
+    has_previous = number > 1 if older else has_more
+    if not cursor:
+        has_previous = False
+    if has_next:
+        result['next_cursor'] = encode_cursor(
+            [rows[-1][1], rows[-1][0], number + 1]
+        )
+    if has_previous:
+        result['previous_cursor'] = encode_cursor(
+            [rows[0][1], rows[0][0], max(number - 1, 1)]
+        )
+    posts = Post.objects.visible().select_related('author', 'group').in_bulk(
+        [post_id for post_id, _, _ in rows]
+    )
+    for post_id, _, snippet in rows:
+        post = posts.get(post_id)
+        if post is not None:
+            post.search_snippet = _highlight(snippet)
+            result['posts'].append(post)
+    return result
+
+
+def matching_posts(queryset, text):
+    '''
+    Посты кверисета, в тексте которых есть все слова запроса, с рангом
+    bm25 в аннотации search_rank (для админки). Условие добавляется через
+    extra(): RawSQL в pk__in превращается в IN ((SELECT ...)), и SQLite
+    сравнивает id только с первой строкой подзапроса.
+    '''
+    query = fts_query(text)
+    rank = RawSQL(
+        'SELECT bm25(posts_post_fts) FROM posts_post_fts '
+        'WHERE posts_post_fts MATCH %s AND rowid = posts_post.id',
+        [query],
+    )
+    return queryset.extra(
+        where=['posts_post.id IN (SELECT rowid FROM posts_post_fts '
+               'WHERE posts_post_fts MATCH %s)'],
+        params=[query],
+    ).annotate(search_rank=rank)
@@ -0,0 +1,151 @@
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from core.signals import replicas_synced
+from core.tasks import defer
+
+from . import counters, images, timeline, trending
+from .caching import (bump_feed_generation, bump_group_generation,
+                      bump_replica_generation)
+from .models import (Comment, Follow, Group, ImageVariant, Post, Suggestion,
+                     User, UserStats)
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    '''
+    Строка счётчиков создаётся вместе с пользователем, чтобы первый
+    просмотр профиля не пересчитывал их.
+    '''
+    if created:
+        UserStats.objects.bulk_create([UserStats(user=instance)],
+                                      ignore_conflicts=True)
+
+
+# Поля пользователя, которые видны в карточках постов.
+CARD_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, instance, created, update_fields, **kwargs):
+    '''
+    Имя автора входит в ключ кэша карточки, но ленты кэшируются
+    целиком: после правки пользователя их кэш сбрасывается. Вход на
+    сайт (update_fields=['last_login']) кэш не трогает.
+    '''
+    if created or (update_fields is not None
+                   and not CARD_USER_FIELDS & set(update_fields)):
+        return
+    bump_feed_generation()
+    defer(timeline.touch_followers, instance.pk)
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    '''
+    Запоминает имя картинки, с которым пост загружен из БД, чтобы после
+    смены картинки освободить старую. Отложенное поле не читается.
+    '''
+    if 'image' in instance.__dict__:
+        instance._loaded_image = instance.image.name
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    '''
+    Превью относится к прежней картинке: после смены картинки его
+    заново создаст prepare_post_images. Новый пост получает начальную
+    оценку "в тренде" за саму публикацию.
+    '''
+    loaded_image = getattr(instance, '_loaded_image', None)
+    if loaded_image is not None and loaded_image != instance.image.name:
+        instance.image_preview = ''
+    if instance._state.adding and not instance.trending:
+        instance.trending = trending.event_score(trending.POST_WEIGHT)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    '''
+    Новый пост рассылается по лентам подписчиков в фоне.
+    После правки поста сбрасывается кэш лент подписчиков.
+    '''
+    if created:
+        counters.change_user_counter(instance.author_id, 'posts_count', 1)
+        defer(timeline.fan_out_post, instance.pk)
+    else:
+        defer(timeline.touch_followers, instance.author_id)
+    loaded_image = getattr(instance, '_loaded_image', None)
+    if loaded_image and loaded_image != instance.image.name:
+        defer(images.release_image, loaded_image)
+    instance._loaded_image = instance.image.name
+    if instance.image:
+        defer(images.prepare_post_images, instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+    defer(timeline.touch_followers, instance.author_id)
+    defer(images.release_image, instance.image.name)
+
+
+@receiver(post_delete, sender=ImageVariant)
+def image_variant_deleted(sender, instance, **kwargs):
+    defer(images.release_variant, instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comments_counter(instance.post_id, 1)
+        trending.comment_added(instance.post_id)
+        defer(timeline.touch_post_followers, instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_comments_counter(instance.post_id, -1)
+    defer(timeline.touch_post_followers, instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.author_id,
+                                     'followers_count', 1)
+        counters.change_user_counter(instance.user_id,
+                                     'following_count', 1)
+        defer(timeline.backfill, instance.user_id, instance.author_id)
+        trending.follower_gained(instance.author_id)
+        # Автор больше не рекомендуется тому, кто на него подписался.
+        Suggestion.objects.filter(user_id=instance.user_id,
+                                  suggested_id=instance.author_id).delete()
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    defer(timeline.prune, instance.user_id, instance.author_id)
+
+
+@receiver([post_save, post_delete], sender=Group)
+def groups_changed(sender, **kwargs):
+    bump_group_generation()
+
+
+@receiver([post_save, post_delete], sender=Post)
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=Group)
+def feed_changed(sender, **kwargs):
+    '''
+    Любая запись в посты, комментарии или группы сбрасывает кэш лент.
+    '''
+    bump_feed_generation()
+
+
+@receiver(replicas_synced)
+def replicas_updated(sender, **kwargs):
+    bump_replica_generation()
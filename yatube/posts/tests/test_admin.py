@@ -0,0 +1,82 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..caching import group_choices
+from ..models import Follow, Group, Post
+
+User = get_user_model()
+
+
+class AdminChangelistTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+        cls.groups = [Group.objects.create(title=f'Группа {i}',
+                                           slug=f'group-{i}',
+                                           description='Описание')
+                      for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(AdminChangelistTest.admin)
+
+    def add_rows(self, number):
+        for i in range(number):
+            author = AdminChangelistTest.authors[i % 3]
+            Post.objects.create(author=author, text=f'Пост {i}',
+                                group=AdminChangelistTest.groups[i % 3])
+            Follow.objects.get_or_create(
+                user=AdminChangelistTest.authors[(i + 1) % 3], author=author
+            )
+
+    def count_queries(self, url):
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        '''
+        Число запросов списка не зависит от числа строк: авторы и группы
+        берутся join-ом, список групп для <select> - из кэша.
+        '''
+        for name in ('posts_post', 'posts_follow'):
+            with self.subTest(name=name):
+                url = reverse(f'admin:{name}_changelist')
+                self.add_rows(3)
+                few = self.count_queries(url)
+                self.add_rows(30)
+                self.assertEqual(self.count_queries(url), few)
+
+    def test_estimated_count(self):
+        '''
+        Без фильтров число постов оценивается по таблице, с поиском -
+        считается, но не дальше EXACT_COUNT_LIMIT.
+        '''
+        self.add_rows(5)
+        url = reverse('admin:posts_post_changelist')
+        with mock.patch('posts.utils.EXACT_COUNT_LIMIT', 2):
+            estimate = self.client.get(url).context['cl'].result_count
+            found = self.client.get(url, {'q': 'пост'}).context['cl']
+        self.assertEqual(estimate, Post.objects.latest('pk').pk)
+        self.assertEqual(found.result_count, 2)
+        self.assertIsNone(found.full_result_count)
+
+    def test_group_choices_follow_changes(self):
+        self.assertEqual(len(group_choices()), 3)
+        group = Group.objects.create(title='Новая', slug='new',
+                                     description='Описание')
+        self.assertIn((group.pk, 'Новая'), group_choices())
+        group.delete()
+        self.assertNotIn((group.pk, 'Новая'), group_choices())
@@ -1,10 +1,15 @@
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from django.urls import reverse
-from ..models import Group, Post
+from django.utils import timezone
 
-from django.core.cache import cache
+from core.signals import replicas_synced
+from ..caching import bump_feed_generation, feed_generation
+from ..deletion import schedule_deletion
+from ..models import Comment, Follow, Group, Post
 
 User = get_user_model()
 
@@ -28,14 +33,296 @@ class CacheTest(TestCase):
             text='Тестовый пост',
         )
 
-    def test_deleted_post_save_in_cache(self):
+    def test_deleted_post_disappears_from_cache(self):
         '''
-        Пост сохраняется в кэше после удаления самого поста из БД.
+        Удалённый пост пропадает с главной страницы на следующем же
+        запросе: удаление увеличивает поколение кэша.
         '''
         response_1 = self.guest_client.get(reverse('posts:index'))
-        Post.objects.get(pk=1).delete()
+        self.post.delete()
+        response_2 = self.guest_client.get(reverse('posts:index'))
+        self.assertNotEqual(response_1.content, response_2.content)
+        self.assertNotContains(response_2, 'Тестовый пост')
+
+    def test_unchanged_feed_served_from_cache(self):
+        '''
+        Пока поколение не изменилось, лента берётся из кэша: правка
+        в обход сигналов (queryset.update) не видна до сброса кэша.
+        '''
+        response_1 = self.guest_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=self.post.pk).update(
+            text='Новый текст', updated=timezone.now()
+        )
         response_2 = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(response_1.content, response_2.content)
-        cache.clear()
+        bump_feed_generation()
         response_3 = self.guest_client.get(reverse('posts:index'))
-        self.assertNotEqual(response_1.content, response_3.content)
+        self.assertContains(response_3, 'Новый текст')
+
+    def test_new_comment_bumps_generation(self):
+        '''
+        Новый комментарий увеличивает поколение кэша лент.
+        '''
+        generation = feed_generation()
+        Comment.objects.create(post=self.post, author=CacheTest.user,
+                               text='Комментарий')
+        self.assertGreater(feed_generation(), generation)
+
+    def test_feeds_refreshed_after_replica_sync(self):
+        '''
+        Лента, отрисованная по отстающей реплике под уже новым
+        поколением, обновляется после sync_replica.
+        '''
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=self.post.pk).update(
+            text='Новый текст', updated=timezone.now()
+        )
+        replicas_synced.send(sender=None)
+        self.assertContains(self.guest_client.get(reverse('posts:index')),
+                            'Новый текст')
+
+
+class FollowCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.other = User.objects.create_user(username='other')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        super().setUp()
+        self.reader_client = Client()
+        self.reader_client.force_login(FollowCacheTest.reader)
+        self.other_client = Client()
+        self.other_client.force_login(FollowCacheTest.other)
+        self.post = Post.objects.create(
+            author=FollowCacheTest.author,
+            text='Пост автора',
+        )
+
+    def test_follow_feed_cached_per_user(self):
+        '''
+        Лента подписок кэшируется отдельно для каждого пользователя.
+        '''
+        url = reverse('posts:follow_index')
+        self.assertContains(self.reader_client.get(url), 'Пост автора')
+        self.assertNotContains(self.other_client.get(url), 'Пост автора')
+        Post.objects.filter(pk=self.post.pk).update(text='Правка',
+                                                    updated=timezone.now())
+        self.assertContains(self.reader_client.get(url), 'Пост автора')
+        replicas_synced.send(sender=None)
+        self.assertContains(self.reader_client.get(url), 'Правка')
+
+    def test_cached_follow_feed_skips_queries(self):
+        '''
+        При попадании в кэш лента, миниатюры и рекомендации не
+        запрашиваются: остаются только сессия и пользователь.
+        '''
+        url = reverse('posts:follow_index')
+        self.reader_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(url)
+        self.assertContains(response, 'Пост автора')
+        tables = ' '.join(query['sql'] for query in queries)
+        for table in ('posts_timelineentry', 'posts_post',
+                      'posts_suggestion'):
+            with self.subTest(table=table):
+                self.assertNotIn(table, tables)
+
+    @override_settings(FEED_CACHE_TIMEOUT=0)
+    def test_follow_feed_timeout_from_settings(self):
+        '''
+        Срок жизни кэша ленты берётся из настроек: без общего кэша он
+        короткий, и страница, устаревшая в другом процессе, не живёт
+        дольше него.
+        '''
+        url = reverse('posts:follow_index')
+        self.reader_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.reader_client.get(url)
+        tables = ' '.join(query['sql'] for query in queries)
+        self.assertIn('posts_timelineentry', tables)
+
+    def test_follow_feed_follows_group_changes(self):
+        '''
+        Ссылка на группу в ленте подписок меняется при смене адреса
+        группы и пропадает при её удалении, хотя ленты читателей эти
+        изменения не трогают.
+        '''
+        group = Group.objects.create(title='Группа', slug='old-slug')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        url = reverse('posts:follow_index')
+        self.assertContains(self.reader_client.get(url), '/group/old-slug/')
+        group.slug = 'new-slug'
+        group.save()
+        response = self.reader_client.get(url)
+        self.assertContains(response, '/group/new-slug/')
+        schedule_deletion(group)
+        response = self.reader_client.get(url)
+        self.assertNotContains(response, '/group/new-slug/')
+
+    def test_follow_feed_invalidated(self):
+        '''
+        Новый пост автора, подписка и отписка видны на следующем же
+        запросе.
+        '''
+        url = reverse('posts:follow_index')
+        self.reader_client.get(url)
+        Post.objects.create(author=FollowCacheTest.author,
+                            text='Свежий пост')
+        self.assertContains(self.reader_client.get(url), 'Свежий пост')
+        Post.objects.create(author=FollowCacheTest.other,
+                            text='Пост другого автора')
+        self.reader_client.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': FollowCacheTest.other.username},
+        ))
+        self.assertContains(self.reader_client.get(url),
+                            'Пост другого автора')
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': FollowCacheTest.author.username},
+        ))
+        self.assertNotContains(self.reader_client.get(url), 'Свежий пост')
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.guest_client = Client()
+        self.post = Post.objects.create(
+            author=PostCardCacheTest.user,
+            group=PostCardCacheTest.group,
+            text='Тестовый пост',
+        )
+
+    def test_card_shared_between_feeds(self):
+        '''
+        Карточка, отрисованная на главной, переиспользуется в ленте
+        группы, пока пост не изменён.
+        '''
+        group_url = reverse('posts:group_list',
+                            kwargs={'slug': PostCardCacheTest.group.slug})
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=self.post.pk).update(text='Правка')
+        self.assertContains(self.guest_client.get(group_url),
+                            'Тестовый пост')
+        self.post.text = 'Правка'
+        self.post.save()
+        self.assertContains(self.guest_client.get(group_url), 'Правка')
+
+    def test_card_refreshed_after_group_change(self):
+        '''
+        Правка группы перерисовывает карточки её постов.
+        '''
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        group = Group.objects.get(pk=PostCardCacheTest.group.pk)
+        group.slug = 'new-slug'
+        group.save()
+        self.assertContains(self.guest_client.get(url), '/group/new-slug/')
+
+    def test_card_refreshed_after_author_rename(self):
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        user = User.objects.get(pk=PostCardCacheTest.user.pk)
+        user.first_name, user.last_name = 'Лев', 'Толстой'
+        user.save()
+        self.assertContains(self.guest_client.get(url), 'Лев Толстой')
+
+    def test_card_refreshed_after_group_deleted(self):
+        '''
+        Карточка не ссылается на удалённую группу, даже если ключ
+        кэша поста (updated) не изменился.
+        '''
+        url = reverse('posts:index')
+        self.assertContains(self.guest_client.get(url), '/group/test-slug/')
+        schedule_deletion(Group.objects.get(pk=PostCardCacheTest.group.pk))
+        self.assertNotContains(self.guest_client.get(url),
+                               '/group/test-slug/')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            group=cls.group,
+            text='Тестовый пост',
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(ConditionalGetTest.reader)
+
+    def test_not_modified(self):
+        '''
+        Повторный запрос с совпадающим ETag получает 304, после записи -
+        снова 200.
+        '''
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list',
+                    kwargs={'slug': ConditionalGetTest.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': ConditionalGetTest.user.username}),
+            reverse('posts:post_detail',
+                    kwargs={'post_id': ConditionalGetTest.post.pk}),
+        ]
+        etags = {}
+        for url in urls:
+            with self.subTest(url=url):
+                etags[url] = self.guest_client.get(url)['ETag']
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 304)
+        Comment.objects.create(post=ConditionalGetTest.post,
+                               author=ConditionalGetTest.reader,
+                               text='Комментарий')
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user_and_follow(self):
+        '''
+        ETag профиля разный для разных пользователей и меняется после
+        подписки.
+        '''
+        url = reverse('posts:profile',
+                      kwargs={'username': ConditionalGetTest.user.username})
+        guest_etag = self.guest_client.get(url)['ETag']
+        reader_etag = self.reader_client.get(url)['ETag']
+        self.assertNotEqual(guest_etag, reader_etag)
+        self.reader_client.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': ConditionalGetTest.user.username},
+        ))
+        response = self.reader_client.get(url,
+                                          HTTP_IF_NONE_MATCH=reader_etag)
+        self.assertEqual(response.status_code, 200)
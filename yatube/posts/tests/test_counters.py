@@ -0,0 +1,118 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..counters import (change_comments_counter, change_user_counter,
+                        get_user_stats)
+from ..models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_writes(self):
+        '''
+        Счётчики меняются вместе с постами, комментариями и подписками.
+        '''
+        get_user_stats(CountersTest.author)
+        get_user_stats(CountersTest.reader)
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        Comment.objects.create(post=post, author=CountersTest.reader,
+                               text='Комментарий')
+        Follow.objects.create(user=CountersTest.reader,
+                              author=CountersTest.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        author = UserStats.objects.get(user=CountersTest.author)
+        reader = UserStats.objects.get(user=CountersTest.reader)
+        self.assertEqual(author.posts_count, 1)
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(reader.following_count, 1)
+        Follow.objects.all().delete()
+        post.comments.all().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        post.delete()
+        author.refresh_from_db()
+        self.assertEqual(author.posts_count, 0)
+        self.assertEqual(author.followers_count, 0)
+
+    def test_recount_repairs_drift(self):
+        '''
+        Команда recount исправляет расхождения счётчиков.
+        '''
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        Comment.objects.create(post=post, author=CountersTest.reader,
+                               text='Комментарий')
+        Follow.objects.create(user=CountersTest.reader,
+                              author=CountersTest.author)
+        UserStats.objects.all().delete()
+        Post.objects.update(comments_count=7)
+        call_command('recount', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        author = UserStats.objects.get(user=CountersTest.author)
+        self.assertEqual(
+            (author.posts_count, author.followers_count), (1, 1)
+        )
+        reader = UserStats.objects.get(user=CountersTest.reader)
+        self.assertEqual(reader.following_count, 1)
+
+    def test_drifted_counters_stay_non_negative(self):
+        '''
+        Уменьшение разошедшегося нулевого счётчика не нарушает CHECK >= 0.
+        '''
+        get_user_stats(CountersTest.author)
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        UserStats.objects.update(followers_count=0)
+        Post.objects.update(comments_count=0)
+        change_user_counter(CountersTest.author.pk, 'followers_count', -1)
+        change_comments_counter(post.pk, -2)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        stats = UserStats.objects.get(user=CountersTest.author)
+        self.assertEqual(stats.followers_count, 0)
+
+    def test_view_transactions_start_with_write(self):
+        '''
+        Представления читают вне транзакции, а транзакция начинается с
+        записи. Иначе SQLite в режиме WAL сразу отвечает "database is
+        locked", если между чтением и записью другое соединение успело
+        зафиксировать свою транзакцию.
+        '''
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        client = Client()
+        client.force_login(CountersTest.reader)
+        author = CountersTest.author.username
+        requests = {
+            'post_create': (reverse('posts:post_create'), {'text': 'Пост'}),
+            'add_comment': (reverse('posts:add_comment', args=[post.pk]),
+                            {'text': 'Комментарий'}),
+            'profile_follow': (reverse('posts:profile_follow',
+                                       args=[author]), None),
+            'profile_unfollow': (reverse('posts:profile_unfollow',
+                                         args=[author]), None),
+        }
+        for name, (url, data) in requests.items():
+            with self.subTest(view=name):
+                with CaptureQueriesContext(connection) as queries:
+                    if data is None:
+                        client.get(url)
+                    else:
+                        client.post(url, data)
+                statements = [query['sql'] for query in queries]
+                for i, sql in enumerate(statements[:-1]):
+                    if sql.startswith('SAVEPOINT'):
+                        self.assertRegex(statements[i + 1],
+                                         '^(INSERT|UPDATE|DELETE)')
@@ -0,0 +1,147 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..deletion import run_deletion, schedule_deletion
+from ..models import (Comment, DeletionJob, Follow, Group, ImageVariant, Post,
+                      TimelineEntry, UserStats)
+from .test_storage import SMALL_GIF
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_RELEASE_DELAY=0)
+@mock.patch('posts.deletion.BATCH_SIZE', 2)
+class DeletionTest(TestCase):
+    '''
+    Удаляемый объект сразу пропадает с сайта, а затем фоновое задание
+    удаляет его и всё зависимое пачками.
+    '''
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='group',
+                                          description='Описание')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        self.posts = [
+            Post.objects.create(author=self.author, group=self.group,
+                                text=f'Пост автора {i}')
+            for i in range(5)
+        ]
+        self.reader_post = Post.objects.create(author=self.reader,
+                                               text='Пост читателя')
+        for i in range(3):
+            Comment.objects.create(post=self.reader_post, author=self.author,
+                                   text=f'Комментарий {i}')
+            Comment.objects.create(post=self.posts[0], author=self.reader,
+                                   text=f'Ответ {i}')
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def schedule(self, obj):
+        '''
+        Ставит удаление. Фоновые задачи в тестах выключены, поэтому
+        задание не выполняется, а ждёт purge_deleted.
+        '''
+        job = schedule_deletion(obj)
+        self.assertTrue(DeletionJob.objects.filter(pk=job.pk).exists())
+        return job
+
+    @override_settings(BACKGROUND_TASKS_ENABLED=True)
+    def test_job_deferred_to_background(self):
+        with mock.patch('posts.deletion.defer') as defer:
+            job = schedule_deletion(self.reader_post)
+        defer.assert_any_call(run_deletion, job.pk)
+
+    def test_user_hidden_then_purged(self):
+        job = self.schedule(self.author)
+        profile = reverse('posts:profile', args=[self.author.username])
+        self.assertEqual(self.client.get(profile).status_code, 404)
+        index = self.client.get(reverse('posts:index'))
+        self.assertEqual(list(index.context['page_obj']), [self.reader_post])
+        detail = self.client.get(
+            reverse('posts:post_detail', args=[self.reader_post.pk])
+        )
+        self.assertEqual(len(detail.context['comments']), 0)
+
+        run_deletion(job.pk)
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
+        self.assertFalse(Comment.objects.filter(author=self.author).exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertFalse(DeletionJob.objects.exists())
+        self.reader_post.refresh_from_db()
+        self.assertEqual(self.reader_post.comments_count, 0)
+        stats = UserStats.objects.get(user=self.reader)
+        self.assertEqual(stats.followers_count, 0)
+        self.assertEqual(stats.following_count, 0)
+
+    def test_post_purged_with_files(self):
+        post = Post.objects.create(
+            author=self.author, text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF,
+                                     content_type='image/gif'),
+        )
+        storage = Post._meta.get_field('image').storage
+        variants = list(ImageVariant.objects.filter(post=post)
+                        .values_list('image', flat=True))
+        job = self.schedule(post)
+        detail = reverse('posts:post_detail', args=[post.pk])
+        self.assertEqual(self.client.get(detail).status_code, 404)
+
+        run_deletion(job.pk)
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertFalse(storage.exists(post.image.name))
+        for name in variants:
+            self.assertFalse(storage.exists(name))
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count,
+                         len(self.posts))
+
+    def test_group_hidden_then_purged(self):
+        job = self.schedule(self.group)
+        url = reverse('posts:group_list', args=[self.group.slug])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        run_deletion(job.pk)
+        self.assertFalse(Group.objects.exists())
+        self.assertEqual(Post.objects.filter(group__isnull=True).count(),
+                         len(self.posts) + 1)
+
+    def test_admin_deletes_outside_request(self):
+        '''
+        Админка только скрывает пользователя и ставит задание, удаляет
+        его purge_deleted.
+        '''
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        url = reverse('admin:auth_user_delete', args=[self.author.pk])
+        self.assertContains(self.client.get(url), self.author.username)
+        self.client.post(url, {'post': 'yes'})
+        self.assertFalse(User.objects.get(pk=self.author.pk).is_active)
+        self.assertTrue(Post.objects.filter(author=self.author).exists())
+
+        call_command('purge_deleted', stdout=StringIO())
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
+        self.assertFalse(DeletionJob.objects.exists())
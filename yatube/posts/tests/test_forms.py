@@ -1,6 +1,14 @@
+import io
 import shutil
+import struct
 import tempfile
+import zlib
+from concurrent import futures
+from unittest import mock
+
+from PIL import Image
 from django.conf import settings
+from django.db import connection
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 from django.contrib.auth import get_user_model
@@ -8,10 +16,15 @@ from django.test import TestCase, Client, override_settings
 
 from django.urls import reverse
 
+from .. import forms
 from ..models import Group, Post
+from .test_storage import SMALL_GIF
 
 User = get_user_model()
 
+# Картинки постов хранятся под sha256 содержимого.
+IMAGE_NAME_REGEX = r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.gif$'
+
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
@@ -77,7 +90,7 @@ class PostFormTests(TestCase):
                 text=form_data['text'],
                 group=form_data['group'],
                 author=form_data['author'],
-                image='posts/small.gif',
+                image__regex=IMAGE_NAME_REGEX,
             ).exists()
         )
 
@@ -119,6 +132,108 @@ class PostFormTests(TestCase):
                 text=form_data['text'],
                 group=PostFormTests.group,
                 author=PostFormTests.user,
-                image='posts/small.gif',
+                image__regex=IMAGE_NAME_REGEX,
             ).exists()
         )
+
+    def test_exif_stripped_on_upload(self):
+        '''
+        Загруженная картинка перекодируется без EXIF и поворачивается
+        по тегу Orientation.
+        '''
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera'
+        buffer = io.BytesIO()
+        image = Image.new('RGB', (40, 20), 'red')
+        image.save(buffer, 'JPEG', exif=exif.tobytes())
+        uploaded = SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                                      content_type='image/jpeg')
+        with self.assertLogs('core.uploads', 'INFO') as logs:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'С EXIF', 'image': uploaded},
+            )
+        self.assertIn('максимальный RSS процесса пула', logs.output[0])
+        post = Post.objects.get(text='С EXIF')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertEqual(len(image.getexif()), 0)
+
+    def test_oversize_image_rejected_by_header(self):
+        '''
+        Картинка 8000×5000 отклоняется по заголовку, без декодирования
+        и без обращения к пулу процессов.
+        '''
+        def chunk(kind, data):
+            return (struct.pack('>I', len(data)) + kind + data
+                    + struct.pack('>I', zlib.crc32(kind + data)))
+
+        header = (b'\x89PNG\r\n\x1a\n'
+                  + chunk(b'IHDR', struct.pack('>IIBBBBB',
+                                               8000, 5000, 8, 2, 0, 0, 0))
+                  + chunk(b'IDAT', zlib.compress(b'\x00' * 16))
+                  + chunk(b'IEND', b''))
+        uploaded = SimpleUploadedFile('huge.png', header,
+                                      content_type='image/png')
+        posts_count = Post.objects.count()
+        with mock.patch('core.uploads._get_pool') as pool:
+            response = self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Огромная картинка', 'image': uploaded},
+            )
+        pool.assert_not_called()
+        self.assertEqual(Post.objects.count(), posts_count)
+        self.assertFormError(response, 'form', 'image',
+                             'Картинка слишком большая: 8000×5000 пикселей.')
+
+    def test_slow_reencode_rejected(self):
+        '''
+        Если процесс пула не перекодировал картинку за
+        UPLOAD_IMAGE_TIMEOUT, картинка отклоняется, а пул пересоздаётся.
+        '''
+        uploaded = SimpleUploadedFile('slow.gif', SMALL_GIF,
+                                      content_type='image/gif')
+        posts_count = Post.objects.count()
+        with mock.patch('core.uploads._get_pool') as pool, \
+                mock.patch('core.uploads._reset_pool') as reset, \
+                self.assertLogs('core.uploads', 'WARNING'):
+            future = pool.return_value.submit.return_value
+            future.result.side_effect = futures.TimeoutError
+            response = self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Медленная картинка', 'image': uploaded},
+            )
+        future.result.assert_called_once_with(
+            timeout=settings.UPLOAD_IMAGE_TIMEOUT
+        )
+        reset.assert_called_once_with(terminate=True)
+        self.assertEqual(Post.objects.count(), posts_count)
+        self.assertFormError(response, 'form', 'image',
+                             'Не удалось обработать картинку.')
+
+    def test_reencode_outside_transaction(self):
+        '''
+        Картинка перекодируется до начала транзакции: запись в БД не
+        ждёт пул процессов до UPLOAD_IMAGE_TIMEOUT секунд.
+        '''
+        uploaded = SimpleUploadedFile('small.gif', SMALL_GIF,
+                                      content_type='image/gif')
+        # TestCase сам держит транзакцию: новая добавила бы точку
+        # сохранения.
+        savepoints = len(connection.savepoint_ids)
+        opened = []
+
+        def reencode(upload):
+            opened.append(len(connection.savepoint_ids) - savepoints)
+            return reencode_upload(upload)
+
+        reencode_upload = forms.reencode_upload
+        with mock.patch.object(forms, 'reencode_upload', reencode):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост с картинкой', 'image': uploaded},
+            )
+        self.assertEqual(opened, [0])
+        self.assertTrue(Post.objects.filter(text='Пост с картинкой')
+                        .exists())
@@ -0,0 +1,116 @@
+import hashlib
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..middleware import (PAGE_CACHE_KEY, PAGE_LOCK_KEY,
+                          AnonymousPageCacheMiddleware)
+from ..models import Post
+
+User = get_user_model()
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(PageCacheTest.user)
+        self.post = Post.objects.create(author=PageCacheTest.user,
+                                        text='Тестовый пост')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_anonymous_pages_cached(self):
+        '''
+        Повторный запрос анонима отдаётся из кэша, авторизованного - нет.
+        '''
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.assertEqual(self.guest_client.get(url)['X-Page-Cache'], 'miss')
+        self.assertEqual(self.guest_client.get(url)['X-Page-Cache'], 'hit')
+        response = self.authorized_client.get(url)
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        response = self.guest_client.get(reverse('about:author'))
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+    def test_write_refreshes_page(self):
+        '''
+        После записи страница пересчитывается на следующем запросе.
+        '''
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        Post.objects.create(author=PageCacheTest.user, text='Новый пост')
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Новый пост')
+
+    def test_stale_page_served_while_refreshing(self):
+        '''
+        Пока другой обработчик пересчитывает страницу, отдаётся старая
+        копия.
+        '''
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        Post.objects.create(author=PageCacheTest.user, text='Новый пост')
+        digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+        cache.add(PAGE_LOCK_KEY.format(digest), 1)
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertNotContains(response, 'Новый пост')
+
+    def test_missing_page_rendered_once(self):
+        '''
+        Если страницы в кэше нет, а другой обработчик её уже отрисовывает,
+        запрос ждёт его результат, а не отрисовывает страницу сам.
+        '''
+        url = reverse('posts:index')
+        digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+        key = PAGE_CACHE_KEY.format(digest)
+        self.guest_client.get(url)
+        entry = cache.get(key)
+        cache.delete(key)
+        cache.add(PAGE_LOCK_KEY.format(digest), 1)
+        with mock.patch('posts.middleware.time.sleep',
+                        side_effect=lambda _: cache.set(key, entry)), \
+                self.assertNumQueries(0):
+            response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+
+    @override_settings(PAGE_CACHE_WAIT_TIMEOUT=0)
+    def test_missing_page_rendered_without_storing_after_wait(self):
+        '''
+        Не дождавшись страницы, запрос отрисовывает её сам и не пишет в
+        кэш: запись остаётся за владельцем блокировки.
+        '''
+        url = reverse('posts:index')
+        digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+        cache.add(PAGE_LOCK_KEY.format(digest), 1)
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'Тестовый пост')
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertIsNone(cache.get(PAGE_CACHE_KEY.format(digest)))
+
+    def test_early_refresh_probability(self):
+        '''
+        Ранний пересчёт тем вероятнее, чем ближе срок истечения.
+        '''
+        middleware = AnonymousPageCacheMiddleware(None)
+        with mock.patch('posts.middleware.feed_generation', return_value=1):
+            entry = {'generation': 1, 'delta': 1.0}
+            with mock.patch('posts.middleware.time.time', return_value=100):
+                with mock.patch('posts.middleware.random.random',
+                                return_value=0.5):
+                    entry['expires'] = 100.5
+                    self.assertTrue(middleware._needs_refresh(entry))
+                    entry['expires'] = 110
+                    self.assertFalse(middleware._needs_refresh(entry))
@@ -0,0 +1,97 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from core.query_budget import (QueryBudgetExceeded, QueryBudgetMiddleware,
+                               query_budget)
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, QUERY_BUDGET_STRICT=True)
+class QueryBudgetTest(TestCase):
+    '''
+    Представления укладываются в свой бюджет запросов при любом числе
+    постов, авторов, групп и комментариев на странице: N+1 в шаблоне
+    превысит бюджет, и middleware выбросит QueryBudgetExceeded.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+        cls.groups = [Group.objects.create(title=f'Группа {i}',
+                                           slug=f'group-{i}',
+                                           description='Описание')
+                      for i in range(3)]
+        cls.posts = [
+            Post.objects.create(author=cls.authors[i % 3],
+                                group=cls.groups[i % 3],
+                                text=f'Пост {i}')
+            for i in range(12)
+        ]
+        for i, author in enumerate(cls.authors):
+            Comment.objects.create(post=cls.posts[0], author=author,
+                                   text=f'Комментарий {i}')
+            Follow.objects.create(user=cls.reader, author=author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(QueryBudgetTest.reader)
+
+    def test_views_within_budget(self):
+        post = QueryBudgetTest.posts[0]
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:trending'),
+            reverse('posts:group_list', kwargs={'slug': post.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': post.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_create'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_report_groups_repeated_queries(self):
+        '''
+        При превышении бюджета отчёт группирует одинаковые запросы.
+        '''
+        @query_budget(2)
+        def view(request):
+            for post in Post.objects.all()[:5]:
+                post.author.username
+            return None
+
+        middleware = QueryBudgetMiddleware(None)
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware.get_response = get_response
+        request = RequestFactory().get('/')
+        with self.assertRaises(QueryBudgetExceeded) as error:
+            middleware(request)
+        report = str(error.exception)
+        self.assertIn('6 запросов к БД при бюджете 2', report)
+        self.assertIn('5 × SELECT', report)
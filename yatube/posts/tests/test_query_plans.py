@@ -0,0 +1,134 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+from ..views import NUMBER_OF_POSTS
+
+User = get_user_model()
+
+# Таблицы, запросы к которым проверяются: сами ленты, комментарии и
+# подписки. Сессии, пользователи по первичному ключу и т. п. не нужны.
+TABLES = ('posts_post', 'posts_timelineentry', 'posts_comment',
+          'posts_follow')
+
+
+class QueryPlanTest(TestCase):
+    '''
+    Запросы, которые выполняют представления, идут по индексам: в плане
+    запроса нет полного прохода по таблице и временной сортировки
+    (TEMP B-TREE). Проверяется SQL, перехваченный при запросе страниц,
+    а не собранный в тесте заново.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        cls.posts = [Post.objects.create(author=cls.user, group=cls.group,
+                                         text=f'Тестовый пост {i}')
+                     for i in range(NUMBER_OF_POSTS + 1)]
+        cls.post = cls.posts[0]
+        Comment.objects.create(post=cls.post, author=cls.follower,
+                               text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(QueryPlanTest.follower)
+
+    def select(self, queries):
+        return [query['sql'] for query in queries
+                if query['sql'].startswith('SELECT')
+                and re.search(r'FROM "({})"'.format('|'.join(TABLES)),
+                              query['sql'])]
+
+    def capture(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, self.select(queries)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndexes(self, sql, allow_scan=True):
+        '''
+        Проход по индексу (SCAN ... USING INDEX) допустим только без
+        курсора: первая страница ленты читается с начала индекса.
+        '''
+        for step in self.explain(sql):
+            self.assertNotIn('TEMP B-TREE', step, sql)
+            if step.startswith('SCAN'):
+                self.assertTrue(allow_scan, f'{step}\n{sql}')
+                self.assertIn('USING', step, f'{step}\n{sql}')
+
+    def pages(self):
+        post = QueryPlanTest.post
+        return {
+            'index': reverse('posts:index'),
+            'trending': reverse('posts:trending'),
+            'group_list': reverse('posts:group_list',
+                                  kwargs={'slug': QueryPlanTest.group.slug}),
+            'profile': reverse('posts:profile',
+                               kwargs={'username': QueryPlanTest.user}),
+            'follow_index': reverse('posts:follow_index'),
+            'post_detail': reverse('posts:post_detail',
+                                   kwargs={'post_id': post.pk}),
+        }
+
+    def test_pages_use_indexes(self):
+        for name, url in self.pages().items():
+            with self.subTest(view=name):
+                _, queries = self.capture(url)
+                self.assertTrue(queries)
+                for sql in queries:
+                    self.assertUsesIndexes(sql)
+
+    def test_cursor_pages_use_indexes(self):
+        '''
+        Следующая страница ленты ищется по индексу от курсора, а не
+        проходом по индексу с начала. Запрос ленты скрывает удалённые
+        посты и посты отключённых авторов (Post.objects.visible()).
+        '''
+        feeds = self.pages()
+        del feeds['post_detail']
+        for name, url in feeds.items():
+            with self.subTest(view=name):
+                response, _ = self.capture(url)
+                cursor = response.context['page_obj'].paginator.next_cursor
+                self.assertIsNotNone(cursor)
+                _, queries = self.capture(url, {'after': cursor})
+                feed = [sql for sql in queries if 'ORDER BY' in sql]
+                self.assertTrue(feed)
+                for sql in feed:
+                    self.assertIn('"auth_user"."is_active" = 1', sql)
+                for sql in queries:
+                    self.assertUsesIndexes(sql, allow_scan=False)
+
+    def test_new_post_uses_indexes(self):
+        '''
+        Создание поста: раздача поста в ленты подписчиков ищет их по
+        индексу подписок.
+        '''
+        self.client.force_login(QueryPlanTest.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('posts:post_create'),
+                             {'text': 'Новый пост'})
+        queries = self.select(queries)
+        self.assertTrue(any('FROM "posts_follow"' in sql for sql in queries))
+        for sql in queries:
+            self.assertUsesIndexes(sql)
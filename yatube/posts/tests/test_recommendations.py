@@ -0,0 +1,100 @@
+from unittest import skipIf
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Follow, Suggestion
+from ..recommendations import np, rebuild_suggestions, suggestions_for
+
+User = get_user_model()
+
+
+class SuggestionsViewTest(TestCase):
+    '''
+    Страницы читают готовые рекомендации одним запросом по индексу.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+        Suggestion.objects.bulk_create(
+            Suggestion(user=cls.user, suggested=author, score=i)
+            for i, author in enumerate(cls.authors)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(SuggestionsViewTest.user)
+
+    def test_pages_show_best_first(self):
+        expected = SuggestionsViewTest.authors[::-1]
+        for url in (reverse('posts:follow_index'),
+                    reverse('posts:profile', args=['author0'])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    [s.suggested for s in response.context['suggestions']],
+                    expected
+                )
+                self.assertContains(response, 'На кого подписаться')
+
+    def test_hidden_after_follow_or_deactivation(self):
+        first, second, third = SuggestionsViewTest.authors
+        Follow.objects.create(user=SuggestionsViewTest.user, author=third)
+        User.objects.filter(pk=second.pk).update(is_active=False)
+        suggested = [s.suggested
+                     for s in suggestions_for(SuggestionsViewTest.user)]
+        self.assertEqual(suggested, [first])
+
+    def test_query_uses_index(self):
+        queryset = Suggestion.objects.filter(user=SuggestionsViewTest.user)
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('suggestion_user_score_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+@skipIf(np is None, 'NumPy не установлен')
+class RebuildSuggestionsTest(TestCase):
+    def setUp(self):
+        self.users = {name: User.objects.create_user(username=name)
+                      for name in ('ann', 'bob', 'cat', 'dan', 'eve')}
+
+    def follow(self, user, author):
+        Follow.objects.create(user=self.users[user],
+                              author=self.users[author])
+
+    def suggested(self, name):
+        return [s.suggested.username
+                for s in Suggestion.objects.filter(user=self.users[name])]
+
+    def test_friends_of_friends_and_cofollows(self):
+        '''
+        ann читает bob, bob читает cat - ann советуется cat.
+        dan читает того же bob и ещё eve - ann советуется и eve, но
+        cat выше: до него два пути.
+        '''
+        self.follow('ann', 'bob')
+        self.follow('bob', 'cat')
+        self.follow('dan', 'bob')
+        self.follow('dan', 'cat')
+        self.follow('dan', 'eve')
+        report = rebuild_suggestions()
+        self.assertEqual(report['edges'], 5)
+        self.assertEqual(self.suggested('ann'), ['cat', 'eve'])
+        self.assertNotIn('bob', self.suggested('dan'))
+
+    def test_stale_suggestions_replaced(self):
+        Suggestion.objects.create(user=self.users['eve'],
+                                  suggested=self.users['ann'], score=1)
+        self.follow('ann', 'bob')
+        rebuild_suggestions()
+        self.assertEqual(self.suggested('eve'), [])
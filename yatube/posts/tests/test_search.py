@@ -0,0 +1,139 @@
+import base64
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..checks import search_triggers_check
+from ..models import Comment, Post
+from ..views import NUMBER_OF_POSTS
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Прогулка по <b>Петербургу</b> белыми ночами',
+        )
+        cls.other = Post.objects.create(author=cls.user,
+                                        text='Совсем другой пост')
+        Comment.objects.create(post=cls.other, author=cls.user,
+                               text='Напомнило поездку в Петербург')
+
+    def setUp(self):
+        self.client = Client()
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('posts:search'),
+                                   {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_finds_posts_and_comments(self):
+        '''
+        Поиск находит пост по началу слова в любом регистре, а также пост,
+        к которому есть подходящий комментарий.
+        '''
+        response = self.search('петербург')
+        self.assertEqual(set(response.context['posts']),
+                         {SearchTest.post, SearchTest.other})
+        self.assertEqual(self.search('ночам').context['posts'],
+                         [SearchTest.post])
+        self.assertEqual(self.search('поездку').context['posts'],
+                         [SearchTest.other])
+
+    def test_snippet_highlighted_and_escaped(self):
+        response = self.search('белыми')
+        snippet = response.context['posts'][0].search_snippet
+        self.assertIn('<mark>белыми</mark>', snippet)
+        self.assertIn('&lt;b&gt;', snippet)
+
+    def test_index_follows_changes(self):
+        '''
+        Триггеры обновляют индекс при правке и удалении поста.
+        '''
+        post = Post.objects.create(author=SearchTest.user,
+                                   text='Старый текст про Казань')
+        post.text = 'Новый текст про Самару'
+        post.save()
+        self.assertEqual(self.search('Казань').context['posts'], [])
+        self.assertEqual(self.search('Самару').context['posts'], [post])
+        post.delete()
+        self.assertEqual(self.search('Самару').context['posts'], [])
+
+    def test_triggers_check(self):
+        '''
+        Все миграции оставляют триггеры на месте, а проверка замечает
+        пропажу любого из них.
+        '''
+        self.assertEqual(search_triggers_check(None), [])
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER posts_post_fts_au')
+        errors = search_triggers_check(None)
+        self.assertEqual([error.id for error in errors], ['posts.E001'])
+        self.assertIn('posts_post_fts_au', errors[0].msg)
+
+    def test_fts_syntax_ignored(self):
+        for query in ('"AND (', 'NEAR(*', '-', ''):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query).context['posts'], [])
+
+    def test_keyset_pages(self):
+        '''
+        Результаты листаются по курсору без повторов и пропусков.
+        '''
+        posts = [Post.objects.create(author=SearchTest.user,
+                                     text=f'Кот номер {i}')
+                 for i in range(NUMBER_OF_POSTS + 5)]
+        first = self.search('кот')
+        second = self.search('кот', after=first.context['next_cursor'])
+        self.assertEqual(len(first.context['posts']), NUMBER_OF_POSTS)
+        self.assertEqual(second.context['number'], 2)
+        self.assertIsNone(second.context['next_cursor'])
+        found = first.context['posts'] + second.context['posts']
+        self.assertEqual(set(found), set(posts))
+        self.assertEqual(len(found), len(posts))
+        back = self.search('кот', before=second.context['previous_cursor'])
+        self.assertEqual(back.context['posts'], first.context['posts'])
+        self.assertIsNone(back.context['previous_cursor'])
+
+    def test_hidden_posts_do_not_shorten_pages(self):
+        '''
+        Удалённые посты и посты отключённых авторов отбрасываются до
+        LIMIT: страница заполнена целиком.
+        '''
+        banned = User.objects.create_user(username='banned', is_active=False)
+        Post.objects.create(author=banned, text='Пёс забаненного автора')
+        for i in range(3):
+            Post.objects.create(author=SearchTest.user, is_deleted=True,
+                                text=f'Удалённый пёс {i}')
+        posts = [Post.objects.create(author=SearchTest.user,
+                                     text=f'Пёс номер {i}')
+                 for i in range(NUMBER_OF_POSTS)]
+        response = self.search('пёс')
+        self.assertEqual(response.context['posts'], posts)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_overflowing_cursor_ignored(self):
+        for raw in (b'[1.0, 1, 1e999]', b'[1.0, 1e20, 2]',
+                    b'[1.0, %d, 2]' % 10 ** 27):
+            with self.subTest(cursor=raw):
+                token = base64.urlsafe_b64encode(raw).decode()
+                response = self.search('петербург', after=token)
+                self.assertEqual(response.context['number'], 1)
+
+    def test_admin_search(self):
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        winter = Post.objects.create(author=SearchTest.user,
+                                     text='Петербург зимой')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:posts_post_changelist'),
+                                   {'q': 'петербург'})
+        self.assertEqual(set(response.context['cl'].result_list),
+                         {SearchTest.post, winter})
@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.thumbnails import ready_thumbnails
+from ..models import ImageVariant, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_RELEASE_DELAY=0)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def tearDown(self):
+        super().tearDown()
+        cache.clear()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, name='small.gif', content=SMALL_GIF):
+        return Post.objects.create(
+            author=ContentAddressedStorageTest.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(name, content,
+                                     content_type='image/gif'),
+        )
+
+    def files(self, directory):
+        path = os.path.join(TEMP_MEDIA_ROOT, directory)
+        return [name for _, _, names in os.walk(path) for name in names]
+
+    def test_same_content_stored_once(self):
+        '''
+        Одна и та же картинка под разными именами хранится одним файлом,
+        а миниатюры и копии для второго поста не создаются заново.
+        '''
+        first = self.create_post()
+        with mock.patch('sorl.thumbnail.default.engine.get_image') as engine, \
+                mock.patch('posts.images._encode_variants') as encode:
+            second = self.create_post(name='repost.GIF')
+        engine.assert_not_called()
+        encode.assert_not_called()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(self.files('posts')) - len(
+            self.files('posts/variants')), 1)
+        self.assertEqual(
+            {v.image.name for v in first.image_variants.all()},
+            {v.image.name for v in second.image_variants.all()},
+        )
+
+    def test_file_deleted_with_last_reference(self):
+        '''
+        Файл картинки, её миниатюры и копии удаляются только вместе с
+        последним постом, который на них ссылается.
+        '''
+        first = self.create_post()
+        second = self.create_post()
+        image = first.image.name
+        variants = [v.image.name for v in first.image_variants.all()]
+        first.delete()
+        storage = Post._meta.get_field('image').storage
+        self.assertTrue(storage.exists(image))
+        thumbnails = ready_thumbnails([second.image], 'card')
+        self.assertIsNotNone(thumbnails[second.image])
+        second.delete()
+        self.assertFalse(storage.exists(image))
+        thumbnails = ready_thumbnails([second.image], 'card')
+        self.assertIsNone(thumbnails[second.image])
+        self.assertFalse(ImageVariant.objects.exists())
+        for name in variants:
+            with self.subTest(variant=name):
+                self.assertFalse(storage.exists(name))
+
+    def test_replaced_image_released(self):
+        '''
+        После смены картинки поста старый файл удаляется, если на него
+        больше никто не ссылается.
+        '''
+        post = self.create_post()
+        old_image = post.image.name
+        post = Post.objects.get(pk=post.pk)
+        post.image = SimpleUploadedFile('other.gif', SMALL_GIF + b'\x00',
+                                        content_type='image/gif')
+        post.save()
+        storage = Post._meta.get_field('image').storage
+        self.assertNotEqual(post.image.name, old_image)
+        self.assertFalse(storage.exists(old_image))
+        self.assertTrue(storage.exists(post.image.name))
+
+    @override_settings(IMAGE_RELEASE_DELAY=60 * 60)
+    def test_fresh_image_released_later(self):
+        '''
+        Недавно сохранённая картинка без ссылок остаётся до запуска
+        release_images после IMAGE_RELEASE_DELAY.
+        '''
+        post = self.create_post()
+        image = post.image.name
+        storage = Post._meta.get_field('image').storage
+        post.delete()
+        self.assertTrue(storage.exists(image))
+        call_command('release_images', stdout=StringIO())
+        self.assertTrue(storage.exists(image))
+        with override_settings(IMAGE_RELEASE_DELAY=0):
+            call_command('release_images', stdout=StringIO())
+        self.assertFalse(storage.exists(image))
+
+    def test_concurrent_save_keeps_file(self):
+        '''
+        Если то же содержимое сохраняется, пока файл удаляется (новый
+        пост ещё не записан в БД), файл остаётся на месте.
+        '''
+        storage = Post._meta.get_field('image').storage
+        name = storage.save('posts/small.gif', ContentFile(SMALL_GIF))
+        os.utime(storage.path(name), (0, 0))
+
+        def is_used():
+            storage.save('posts/repost.gif', ContentFile(SMALL_GIF))
+            return False
+
+        self.assertFalse(storage.delete_unused(name, is_used, 60))
+        self.assertTrue(storage.exists(name))
+        os.utime(storage.path(name), (0, 0))
+        self.assertTrue(storage.delete_unused(name, lambda: False, 60))
+        self.assertFalse(storage.exists(name))
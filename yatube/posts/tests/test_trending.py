@@ -0,0 +1,106 @@
+import math
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Comment, Follow, Post
+from ..trending import (COMMENT_WEIGHT, FOLLOW_WEIGHT, FOLLOW_WINDOW,
+                        HALF_LIFE, POST_WEIGHT, event_score)
+from ..views import NUMBER_OF_POSTS
+
+User = get_user_model()
+
+
+class TrendingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def age(self, post, delta):
+        '''
+        Делает вид, что пост опубликован delta назад.
+        '''
+        when = timezone.now() - delta
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=when, trending=event_score(POST_WEIGHT, when)
+        )
+
+    def feed(self, **params):
+        response = self.client.get(reverse('posts:trending'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_score_is_decayed_sum(self):
+        '''
+        Оценка - логарифм суммы весов событий, и каждый HALF_LIFE вес
+        события уменьшается вдвое.
+        '''
+        post = Post.objects.create(author=TrendingTest.author, text='Пост')
+        self.age(post, HALF_LIFE)
+        for _ in range(2):
+            Comment.objects.create(post=post, author=TrendingTest.reader,
+                                   text='Комментарий')
+        post.refresh_from_db()
+        expected = event_score(POST_WEIGHT / 2 + 2 * COMMENT_WEIGHT)
+        self.assertAlmostEqual(post.trending, expected, places=3)
+
+    def test_discussed_post_beats_newer_one(self):
+        old = Post.objects.create(author=TrendingTest.author, text='Старый')
+        new = Post.objects.create(author=TrendingTest.author, text='Новый')
+        self.age(old, HALF_LIFE * 2)
+        self.assertEqual(list(self.feed()), [new, old])
+        for _ in range(3):
+            Comment.objects.create(post=old, author=TrendingTest.reader,
+                                   text='Комментарий')
+        self.assertEqual(list(self.feed()), [old, new])
+
+    def test_follow_credits_recent_posts(self):
+        recent = Post.objects.create(author=TrendingTest.author,
+                                     text='Свежий')
+        stale = Post.objects.create(author=TrendingTest.author,
+                                    text='Давний')
+        self.age(stale, FOLLOW_WINDOW * 2)
+        before = {post.pk: post.trending for post in Post.objects.all()}
+        Follow.objects.create(user=TrendingTest.reader,
+                              author=TrendingTest.author)
+        recent.refresh_from_db()
+        stale.refresh_from_db()
+        self.assertAlmostEqual(
+            recent.trending,
+            math.log(math.exp(before[recent.pk] - event_score(1))
+                     + FOLLOW_WEIGHT) + event_score(1),
+            places=3,
+        )
+        self.assertEqual(stale.trending, before[stale.pk])
+
+    def test_keyset_pages(self):
+        posts = [Post.objects.create(author=TrendingTest.author,
+                                     text=f'Пост {i}')
+                 for i in range(NUMBER_OF_POSTS + 3)]
+        for i, post in enumerate(posts):
+            self.age(post, timedelta(minutes=i))
+        first = self.feed()
+        second = self.feed(after=first.paginator.next_cursor)
+        self.assertEqual(list(first) + list(second), posts)
+
+    def test_feed_uses_index(self):
+        queryset = Post.objects.visible().select_related(
+            'author', 'group'
+        ).order_by('-trending', '-pk')[:NUMBER_OF_POSTS + 1]
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('post_trending_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
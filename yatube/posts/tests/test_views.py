@@ -1,6 +1,10 @@
+import base64
+import hashlib
+import json
 import shutil
 import tempfile
 from time import sleep
+from unittest import mock
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from http import HTTPStatus
@@ -9,10 +13,12 @@ from django.contrib.auth import get_user_model
 from django.test import TestCase, Client, override_settings
 
 from django.urls import reverse
+from core.thumbnails import ready_thumbnails
+from .. import timeline
 from ..forms import PostForm
-from ..models import Comment, Group, Post, Follow
+from ..models import Comment, Group, Post, Follow, TimelineEntry
 from ..utils import paginator
-from ..views import NUMBER_OF_POSTS, PAGE_POSTS_OF_USER
+from ..views import COMMENTS_PER_PAGE, NUMBER_OF_POSTS, PAGE_POSTS_OF_USER
 from django.core.cache import cache
 
 User = get_user_model()
@@ -100,6 +106,95 @@ class PostTests(TestCase):
         object = response.context['post']
         self.assertEqual(object, PostTests.post)
 
+    def test_thumbnail_generated_on_save(self):
+        '''
+        Миниатюра картинки создаётся при сохранении поста, и страница
+        поста показывает её без обработки картинки.
+        '''
+        image = PostTests.post.image
+        thumbnail = ready_thumbnails([image], 'card')[image]
+        self.assertIsNotNone(thumbnail)
+        url = reverse('posts:post_detail', kwargs={'post_id':
+                      PostTests.post.pk})
+        with mock.patch('sorl.thumbnail.default.engine.get_image') as engine:
+            response = self.guest_client.get(url)
+        engine.assert_not_called()
+        self.assertContains(response, thumbnail.url)
+
+    def test_image_variants_in_srcset(self):
+        '''
+        При сохранении создаются копии картинки для srcset, и страница
+        поста перечисляет их с шириной.
+        '''
+        variants = PostTests.post.image_variants.all()
+        self.assertTrue(variants.filter(format='jpeg').exists())
+        url = reverse('posts:post_detail', kwargs={'post_id':
+                      PostTests.post.pk})
+        response = self.guest_client.get(url)
+        for variant in variants:
+            with self.subTest(variant=variant.url):
+                self.assertContains(response,
+                                    f'{variant.url} {variant.width}w')
+
+    def test_placeholder_until_thumbnail_ready(self):
+        '''
+        Пока миниатюра не готова, вместо картинки выводится заглушка.
+        '''
+        url = reverse('posts:post_detail', kwargs={'post_id':
+                      PostTests.post.pk})
+        with mock.patch('posts.images.ready_thumbnails', return_value={}):
+            response = self.guest_client.get(url)
+        self.assertContains(response, 'aspect-ratio')
+        self.assertNotContains(response, '<img class="card-img')
+
+    def test_image_preview_inlined(self):
+        '''
+        При сохранении поста создаётся крошечное превью картинки, и
+        карточка встраивает его, а саму картинку грузит лениво.
+        '''
+        post = Post.objects.get(pk=PostTests.post.pk)
+        self.assertTrue(
+            post.image_preview.startswith('data:image/jpeg;base64,')
+        )
+        self.assertLess(len(post.image_preview), 2000)
+        newer = Post.objects.create(author=PostTests.user, text='Новый пост',
+                                    image=PostTests.post.image.name)
+        cache.clear()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, post.image_preview)
+        self.assertContains(response, 'loading="lazy"', count=1)
+        self.assertContains(response, 'loading="eager" fetchpriority="high"',
+                            count=1)
+        self.assertLess(
+            response.content.index(b'loading="eager"'),
+            response.content.index(b'loading="lazy"'),
+        )
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=[newer.pk])
+        )
+        self.assertContains(response, 'loading="eager" fetchpriority="high"')
+        self.assertNotContains(response, 'loading="lazy"')
+
+    def test_page_thumbnails_in_one_lookup(self):
+        '''
+        Миниатюры всех карточек ленты ищутся одним запросом к кэшу,
+        а не отдельным поиском на каждую карточку.
+        '''
+        for i in range(3):
+            Post.objects.create(author=PostTests.user, text=f'Пост {i}',
+                                image=PostTests.post.image.name)
+        image = PostTests.post.image
+        thumbnail = ready_thumbnails([image], 'card')[image]
+        cache.clear()
+        with mock.patch.object(cache, 'get_many',
+                               wraps=cache.get_many) as get_many, \
+                mock.patch('sorl.thumbnail.kvstores.cached_db_kvstore'
+                           '.KVStore._get_raw') as get_raw:
+            response = self.guest_client.get(reverse('posts:index'))
+        get_many.assert_called_once()
+        get_raw.assert_not_called()
+        self.assertContains(response, thumbnail.url, count=4)
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PaginatorViewsTest(TestCase):
@@ -136,6 +231,8 @@ class PaginatorViewsTest(TestCase):
         )
         cls.posts[12].image = uploaded
         cls.posts[12].save()
+        digest = hashlib.sha256(small_gif).hexdigest()
+        cls.image_name = f'posts/{digest[:2]}/{digest}.gif'
 
     def setUp(self):
         self.guest_client = Client()
@@ -186,6 +283,42 @@ class PaginatorViewsTest(TestCase):
                 value = len(response.context['page_obj'].object_list)
                 self.assertEqual(value, expected)
 
+    def test_cursor_pages(self):
+        '''
+        Переход по курсорам ?after=/?before= отдаёт соседние страницы
+        и не выполняет COUNT(*).
+        '''
+        url = reverse('posts:index')
+        first = self.client.get(url).context['page_obj']
+        token = first.paginator.next_cursor
+        # Один запрос страницы и один - копий картинок (prefetch).
+        with self.assertNumQueries(2):
+            second = self.client.get(url, {'after': token})
+        second = second.context['page_obj']
+        self.assertEqual(len(second.object_list), 3)
+        self.assertEqual(second.number, 2)
+        self.assertFalse(second.has_next())
+        self.assertEqual(second.object_list,
+                         list(PaginatorViewsTest.posts[2::-1]))
+        token = second.paginator.previous_cursor
+        back = self.client.get(url, {'before': token}).context['page_obj']
+        self.assertEqual(back.object_list, first.object_list)
+        self.assertFalse(back.has_previous())
+        broken = self.client.get(url, {'after': 'broken'})
+        self.assertEqual(broken.context['page_obj'].number, 1)
+        # Номер страницы 1e999 превращается в inf, и int() падает.
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        raw = raw.decode().rsplit(',', 1)[0] + ', 1e999]'
+        huge = base64.urlsafe_b64encode(raw.encode()).decode()
+        response = self.client.get(url, {'after': huge})
+        self.assertEqual(response.context['page_obj'].number, 1)
+        # id больше 64-битного целого SQLite.
+        date = json.loads(raw)[0]
+        raw = json.dumps([date, str(10 ** 30), 2]).encode()
+        huge = base64.urlsafe_b64encode(raw).decode()
+        response = self.client.get(url, {'after': huge})
+        self.assertEqual(response.context['page_obj'].number, 1)
+
     def test_pages_contains_post_with_group(self):
         '''На страницах отображается новый созданный пост.'''
         obj = Post.objects.create(
@@ -217,7 +350,8 @@ class PaginatorViewsTest(TestCase):
         post_list = Post.objects.select_related('author', 'group').all()
         page_obj = paginator(response.context['request'],
                              post_list, NUMBER_OF_POSTS)
-        self.assertEqual(object.object_list[0].image, 'posts/small.gif')
+        self.assertEqual(object.object_list[0].image,
+                         PaginatorViewsTest.image_name)
         self.assertEqual(object.object_list, list(page_obj.object_list))
         self.assertIsInstance(object, type(page_obj))
 
@@ -231,7 +365,8 @@ class PaginatorViewsTest(TestCase):
         post_list = group.posts.all()
         page_obj = paginator(response.context['request'],
                              post_list, NUMBER_OF_POSTS)
-        self.assertEqual(object.object_list[0].image, 'posts/small.gif')
+        self.assertEqual(object.object_list[0].image,
+                         PaginatorViewsTest.image_name)
         self.assertEqual(object.object_list, list(page_obj.object_list))
         self.assertIsInstance(object, type(page_obj))
 
@@ -245,7 +380,8 @@ class PaginatorViewsTest(TestCase):
         post_list = user.posts.all()
         page_obj = paginator(response.context['request'],
                              post_list, PAGE_POSTS_OF_USER)
-        self.assertEqual(object.object_list[0].image, 'posts/small.gif')
+        self.assertEqual(object.object_list[0].image,
+                         PaginatorViewsTest.image_name)
         self.assertEqual(object.object_list, list(page_obj.object_list))
         self.assertIsInstance(object, type(page_obj))
 
@@ -327,6 +463,68 @@ class CommentTest(TestCase):
                          response.context['comments'][0])
 
 
+class CommentPagesTest(TestCase):
+    '''
+    Комментарии на странице поста выводятся постранично, остальные
+    подгружаются фрагментом по курсору.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commenter')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(COMMENTS_PER_PAGE * 2 + 5)
+        )
+        cls.comments = list(cls.post.comments.order_by('created', 'pk'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_detail_renders_first_page(self):
+        response = self.client.get(
+            reverse('posts:post_detail', args=[CommentPagesTest.post.pk])
+        )
+        comments = response.context['comments']
+        self.assertEqual(list(comments),
+                         CommentPagesTest.comments[:COMMENTS_PER_PAGE])
+        self.assertContains(
+            response, reverse('posts:post_comments',
+                              args=[CommentPagesTest.post.pk])
+        )
+
+    def test_fragment_pages(self):
+        '''
+        Фрагменты по курсору отдают все комментарии по порядку, без
+        повторов, и не содержат шапки сайта.
+        '''
+        url = reverse('posts:post_comments', args=[CommentPagesTest.post.pk])
+        detail = self.client.get(
+            reverse('posts:post_detail', args=[CommentPagesTest.post.pk])
+        )
+        seen = list(detail.context['comments'])
+        cursor = detail.context['comments'].paginator.next_cursor
+        while cursor:
+            response = self.client.get(url, {'after': cursor})
+            self.assertNotContains(response, '<header')
+            page = response.context['comments']
+            seen += list(page)
+            cursor = page.paginator.next_cursor if page.has_next() else None
+        self.assertEqual(seen, CommentPagesTest.comments)
+
+    def test_fragment_of_hidden_post_not_found(self):
+        hidden = Post.objects.create(author=CommentPagesTest.user,
+                                     text='Удалённый', is_deleted=True)
+        for post_id in (hidden.pk, hidden.pk + 1000):
+            with self.subTest(post_id=post_id):
+                response = self.client.get(
+                    reverse('posts:post_comments', args=[post_id])
+                )
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
 class FollowingTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -387,3 +585,45 @@ class FollowingTest(TestCase):
                       response.context['page_obj'].object_list)
         self.assertNotIn(Post.objects.get(pk=2),
                          response.context['page_obj'].object_list)
+
+    def test_timeline_follows_subscriptions(self):
+        '''
+        Пост автора попадает в ленту подписчика, при подписке лента
+        дозаполняется старыми постами, при отписке - очищается.
+        '''
+        post = Post.objects.create(text='Текст user3',
+                                   author=FollowingTest.user3)
+        timeline = TimelineEntry.objects.filter(user=FollowingTest.user1)
+        self.assertFalse(timeline.filter(post=post).exists())
+        self.user1_client.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': FollowingTest.user3.username},
+        ))
+        self.assertTrue(timeline.filter(post=post).exists())
+        self.user1_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': FollowingTest.user3.username},
+        ))
+        self.assertFalse(timeline.filter(post=post).exists())
+
+    def test_late_timeline_tasks_after_unfollow(self):
+        '''
+        Дозаполнение и рассылка, выполненные после отписки и её
+        очистки ленты, не оставляют в ленте постов автора.
+        '''
+        post = Post.objects.create(text='Текст user3',
+                                   author=FollowingTest.user3)
+        timeline_entries = TimelineEntry.objects.filter(
+            user=FollowingTest.user1, post=post,
+        )
+        Follow.objects.create(user=FollowingTest.user1,
+                              author=FollowingTest.user3)
+        Follow.objects.filter(user=FollowingTest.user1,
+                              author=FollowingTest.user3).delete()
+        timeline.backfill(FollowingTest.user1.pk, FollowingTest.user3.pk)
+        self.assertFalse(timeline_entries.exists())
+        # Список подписчиков прочитан рассылкой до отписки.
+        with mock.patch.object(timeline, '_followers',
+                               return_value=[FollowingTest.user1.pk]):
+            timeline.fan_out_post(post.pk)
+        self.assertFalse(timeline_entries.exists())
@@ -0,0 +1,112 @@
+from .caching import touch_timelines
+from .models import Follow, Post, TimelineEntry
+
+# Размер пачки для bulk_create при рассылке и дозаполнении ленты.
+BATCH_SIZE = 500
+
+
+def _entries(user_ids, posts):
+    return [
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for user_id in user_ids
+        for post_id, pub_date in posts
+    ]
+
+
+def _batches(iterable):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _followers(author_id):
+    return (Follow.objects.filter(author_id=author_id)
+            .values_list('user_id', flat=True).iterator())
+
+
+def _unfollowed(user_ids, author_id):
+    '''
+    Кто из user_ids уже не подписан на автора. Проверяется после
+    вставки пачки: prune отписки, выполненный раньше вставки, её бы не
+    убрал, а сама отписка к этому моменту уже видна. Если же отписка
+    позже проверки, её prune выполнится после вставки и уберёт пачку.
+    '''
+    return set(user_ids) - set(
+        Follow.objects.filter(user_id__in=user_ids, author_id=author_id)
+        .values_list('user_id', flat=True)
+    )
+
+
+def fan_out_post(post_id):
+    '''
+    Рассылает новый пост в ленты всех подписчиков его автора. Записи
+    тех, кто успел отписаться, пока шла рассылка, удаляются.
+    '''
+    post = (Post.objects.filter(pk=post_id)
+            .values_list('pk', 'pub_date', 'author_id').first())
+    if post is None:
+        return
+    post_id, pub_date, author_id = post
+    for user_ids in _batches(_followers(author_id)):
+        TimelineEntry.objects.bulk_create(
+            _entries(user_ids, [(post_id, pub_date)]),
+            ignore_conflicts=True,
+        )
+        gone = _unfollowed(user_ids, author_id)
+        if gone:
+            TimelineEntry.objects.filter(user_id__in=gone,
+                                         post_id=post_id).delete()
+        touch_timelines(user_ids)
+
+
+def touch_followers(author_id):
+    '''
+    Сбрасывает кэш лент подписчиков автора после правки или удаления
+    его поста.
+    '''
+    for user_ids in _batches(_followers(author_id)):
+        touch_timelines(user_ids)
+
+
+def touch_post_followers(post_id):
+    '''
+    Сбрасывает кэш лент подписчиков автора поста (например, после
+    нового комментария, который меняет счётчик на карточке поста).
+    '''
+    author_id = (Post.objects.filter(pk=post_id)
+                 .values_list('author_id', flat=True).first())
+    if author_id is not None:
+        touch_followers(author_id)
+
+
+def backfill(user_id, author_id):
+    '''
+    Дозаполняет ленту подписчика постами автора после подписки. Если
+    подписчик отписался, пока шло дозаполнение, лента очищается от
+    постов автора и дозаполнение прекращается.
+    '''
+    posts = (Post.objects.filter(author_id=author_id)
+             .values_list('pk', 'pub_date').iterator())
+    for batch in _batches(posts):
+        TimelineEntry.objects.bulk_create(
+            _entries([user_id], batch), ignore_conflicts=True,
+        )
+        if _unfollowed([user_id], author_id):
+            prune(user_id, author_id)
+            return
+    touch_timelines([user_id])
+
+
+def prune(user_id, author_id):
+    '''
+    Убирает из ленты подписчика посты автора после отписки.
+    '''
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id,
+    ).delete()
+    touch_timelines([user_id])
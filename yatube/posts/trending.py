@@ -0,0 +1,64 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from .caching import bump_feed_generation
+from .models import Post
+
+# Оценка "в тренде" - это сумма весов событий поста (публикация,
+# комментарии, подписки на автора), каждый из которых вдвое теряет вес
+# за HALF_LIFE. Вместо того чтобы уменьшать оценки всех постов со
+# временем, вес события в момент t хранится умноженным на
+# 2 ** ((t - EPOCH) / HALF_LIFE): общий для всех постов множитель не
+# меняет порядок, и столбец меняется только при новом событии. Чтобы
+# не было переполнения, в столбце лежит натуральный логарифм суммы.
+EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+HALF_LIFE = timedelta(hours=12)
+POST_WEIGHT = 1.0
+COMMENT_WEIGHT = 1.0
+FOLLOW_WEIGHT = 2.0
+# Подписка на автора засчитывается его постам за это время: скорее
+# всего, на автора подписались из-за них.
+FOLLOW_WINDOW = timedelta(days=3)
+
+
+def event_score(weight, when=None):
+    '''
+    Логарифм веса события с поправкой на время: каждые HALF_LIFE
+    прибавляют ln 2.
+    '''
+    when = when or timezone.now()
+    age = (when - EPOCH) / HALF_LIFE
+    return math.log(weight) + age * math.log(2)
+
+
+def _add(score):
+    '''
+    Выражение для UPDATE: trending = ln(e^trending + e^score), в
+    устойчивом виде max(a, b) + ln(1 + e^-|a - b|).
+    '''
+    score = Value(score, output_field=FloatField())
+    return (Greatest(F('trending'), score)
+            + Ln(Value(1.0) + Exp(-Abs(F('trending') - score))))
+
+
+def add_event(posts, weight, when=None):
+    '''
+    Добавляет событие с весом weight постам кверисета одним UPDATE
+    без чтения оценок. Возвращает число обновлённых постов.
+    '''
+    return posts.update(trending=_add(event_score(weight, when)))
+
+
+def comment_added(post_id):
+    add_event(Post.objects.filter(pk=post_id), COMMENT_WEIGHT)
+
+
+def follower_gained(author_id):
+    since = timezone.now() - FOLLOW_WINDOW
+    if add_event(Post.objects.filter(author_id=author_id,
+                                     pub_date__gte=since), FOLLOW_WEIGHT):
+        bump_feed_generation()
@@ -1,18 +1,218 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import json
 
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
 
-def paginator(request, queryset, number_of_notes):
+from core.db import estimate_count
+
+# Старые ссылки вида ?page=N обслуживаются через OFFSET только для первых
+# страниц. Всё, что глубже, доступно лишь по курсорам ?after=/?before=.
+MAX_OFFSET_PAGE = 10
+# До скольких записей EstimatedCountPaginator считает точно. Таблицы
+# больше этого получают оценку, отфильтрованные выборки - счёт с
+# потолком.
+EXACT_COUNT_LIMIT = 10000
+# Целые в SQLite 64-битные: большее значение из курсора уронило бы
+# запрос с OverflowError.
+MAX_INTEGER = 2 ** 63
+
+
+class KeysetPaginator(Paginator):
+    '''
+    Паджинатор "по ключу" (keyset/cursor pagination).
+    Вместо LIMIT/OFFSET и COUNT(*) страница выбирается условием
+    (pub_date, id) < (значения последней записи предыдущей страницы),
+    поэтому стоимость запроса не зависит от глубины страницы.
+    Входные аргументы:
+    object_list - кверисет записей из таблицы из БД
+    per_page - число записей на одной странице
+    keys - поля, по которым упорядочены записи (последнее - уникальное)
+    descending - записи упорядочены по убыванию ключа
+    '''
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk'),
+                 descending=True):
+        super().__init__(object_list, per_page)
+        self.keys = keys
+        self.descending = descending
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._num_pages = 1
+
+    @property
+    def count(self):
+        '''
+        Точное число записей не считается - это и есть COUNT(*),
+        от которого мы уходим. Возвращается число записей на уже
+        известных страницах.
+        '''
+        return self._num_pages * self.per_page
+
+    @property
+    def num_pages(self):
+        return self._num_pages
+
+    @property
+    def page_range(self):
+        return range(1, self._num_pages + 1)
+
+    def _ordering(self, descending):
+        prefix = '-' if descending else ''
+        return [prefix + key for key in self.keys]
+
+    def _key_filter(self, values, older):
+        '''
+        Строит условие (k1, k2, ...) < (v1, v2, ...) (или ">") в виде
+        дизъюнкции. Дополнительное условие k1 <= v1 задаёт границу
+        диапазона, по которой SQLite ищет по составному индексу,
+        а не просматривает его с начала.
+        '''
+        lookup = 'lt' if older == self.descending else 'gt'
+        condition = Q()
+        for i, key in enumerate(self.keys):
+            prefix = {k: v for k, v in zip(self.keys[:i], values[:i])}
+            prefix[f'{key}__{lookup}'] = values[i]
+            condition |= Q(**prefix)
+        return Q(**{f'{self.keys[0]}__{lookup}e': values[0]}) & condition
+
+    def _field(self, key):
+        meta = self.object_list.model._meta
+        return meta.pk if key == 'pk' else meta.get_field(key)
+
+    def encode_cursor(self, obj, number):
+        values = [
+            self._field(key).value_to_string(obj) for key in self.keys
+        ]
+        raw = json.dumps(values + [number]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        '''
+        Разбирает курсор. Для испорченного курсора возвращает None,
+        и пользователь получает первую страницу.
+        '''
+        try:
+            padding = '=' * (-len(token) % 4)
+            raw = base64.urlsafe_b64decode(token + padding)
+            *values, number = json.loads(raw)
+            if len(values) != len(self.keys):
+                return None
+            values = [
+                self._field(key).to_python(value)
+                for key, value in zip(self.keys, values)
+            ]
+            if any(isinstance(value, int) and abs(value) >= MAX_INTEGER
+                   for value in values):
+                return None
+            return values, max(int(number), 1)
+        except (ValueError, TypeError, OverflowError, binascii.Error,
+                ValidationError):
+            return None
+
+    def _build_page(self, rows, number, has_previous, has_next):
+        if has_previous:
+            number = max(number, 2)
+        else:
+            number = 1
+        self._num_pages = number + 1 if has_next else number
+        if rows and has_next:
+            self.next_cursor = self.encode_cursor(rows[-1], number + 1)
+        if rows and has_previous:
+            self.previous_cursor = self.encode_cursor(rows[0], number - 1)
+        return Page(rows, number, self)
+
+    def offset_page(self, number):
+        '''
+        Страница по номеру (старые ссылки ?page=N). Вместо COUNT(*)
+        запрашивается на одну запись больше, чтобы узнать, есть ли
+        следующая страница.
+        '''
+        bottom = (number - 1) * self.per_page
+        queryset = self.object_list.order_by(*self._ordering(self.descending))
+        rows = list(queryset[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            return self.offset_page(1)
+        has_next = len(rows) > self.per_page
+        return self._build_page(rows[:self.per_page], number,
+                                number > 1, has_next)
+
+    def cursor_page(self, values, number, older):
+        '''
+        Страница после (older=True) или перед курсором.
+        '''
+        descending = self.descending == older
+        queryset = self.object_list.filter(
+            self._key_filter(values, older)
+        ).order_by(*self._ordering(descending))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if older:
+            if not rows:
+                return self.offset_page(1)
+            return self._build_page(rows, number, True, has_more)
+        rows.reverse()
+        if not rows:
+            return self.offset_page(1)
+        return self._build_page(rows, number, has_more, True)
+
+    def get_page_from_params(self, params):
+        '''
+        Возвращает страницу по параметрам запроса:
+        ?after=<курсор>, ?before=<курсор> или ?page=N.
+        '''
+        for name, older in (('after', True), ('before', False)):
+            token = params.get(name)
+            if token:
+                cursor = self.decode_cursor(token)
+                if cursor is not None:
+                    values, number = cursor
+                    return self.cursor_page(values, number, older)
+        try:
+            number = int(params.get('page') or 1)
+        except ValueError:
+            number = 1
+        if number < 1 or number > MAX_OFFSET_PAGE:
+            number = 1
+        return self.offset_page(number)
+
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    Паджинатор для списков админки на больших таблицах. Без фильтров
+    число записей берётся из статистики БД (estimate_count), с фильтром
+    или поиском - COUNT(*) по первым EXACT_COUNT_LIMIT записям, так что
+    дальше этой границы страниц не видно.
+    '''
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > EXACT_COUNT_LIMIT:
+                return estimate
+        return queryset[:EXACT_COUNT_LIMIT].count()
+
+
+def paginator(request, queryset, number_of_notes, keys=('pub_date', 'pk'),
+              descending=True):
     '''
-    Ф-ия использует Paginator из Django для разбиения информации на страницы.
-    Здесь мы разбиваем кверисет записей из таблицы из БД на страницы, на каждой
-    из которых определённое число записей. А затем возвращаем одну из страниц.
+    Ф-ия разбивает кверисет записей из таблицы из БД на страницы, на каждой
+    из которых определённое число записей, и возвращает одну из страниц.
+    Используется KeysetPaginator: страницы выбираются по курсору
+    (?after=/?before=), а не через OFFSET, поэтому время ответа
+    не зависит от глубины страницы.
     Входные аргументы:
     request - запрос
     queryset - множество записей из таблицы из БД
     number_of_notes - число записей из таблицы из БД на одной странице
+    keys - поля, по которым упорядочены записи (последнее - уникальное)
+    descending - записи упорядочены по убыванию ключа
     Выходные аргументы:
     Одна страница (из кучи страниц) с определённым числом записей на ней.
     '''
-    paginator = Paginator(queryset, number_of_notes)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    keyset = KeysetPaginator(queryset, number_of_notes, keys, descending)
+    return keyset.get_page_from_params(request.GET)
@@ -1,14 +1,30 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.views.decorators.http import condition
 
+from .caching import (feed_etag, feed_generation, follow_page_key,
+                      profile_etag)
+from .counters import get_user_stats
 from .forms import CommentForm, PostForm
-from .models import Group, Post, User, Follow
+from .images import attach_thumbnails
+from .models import Comment, Follow, Group, Post, TimelineEntry, User
+from .recommendations import suggestions_for
+from .search import search_posts
 from .utils import paginator
 from django.contrib.auth.decorators import login_required
 
+from core.query_budget import query_budget
+
 NUMBER_OF_POSTS = 10
 PAGE_POSTS_OF_USER = 2
+COMMENTS_PER_PAGE = 20
 
 
+@query_budget(6)
+@condition(etag_func=feed_etag)
 def index(request):
     '''
     Позволяет перенести в HTML-код главной страницы сайта записи из
@@ -16,17 +32,45 @@ def index(request):
     Записи из "Post" отсортированы по убыванию даты публикации.
     Записей взято - первые 10 штук.
     '''
-    post_list = Post.objects.select_related('author', 'group').all()
+    post_list = Post.objects.visible().select_related(
+        'author', 'group'
+    ).prefetch_related('image_variants')
     page_obj = paginator(request, post_list, NUMBER_OF_POSTS)
+    attach_thumbnails(page_obj.object_list)
     template = 'posts/index.html'
     title = 'Последние обновления на сайте'
     context = {
         'page_obj': page_obj,
         'title': title,
+        'feed_generation': feed_generation(),
     }
     return render(request, template, context)
 
 
+@query_budget(6)
+@condition(etag_func=feed_etag)
+def trending(request):
+    '''
+    Лента постов "в тренде": по оценке из комментариев, подписок на
+    автора и свежести (см. posts.trending). Оценка хранится в столбце с
+    индексом, поэтому страница стоит столько же, сколько главная.
+    '''
+    post_list = Post.objects.visible().select_related(
+        'author', 'group'
+    ).prefetch_related('image_variants')
+    page_obj = paginator(request, post_list, NUMBER_OF_POSTS,
+                         keys=('trending', 'pk'))
+    attach_thumbnails(page_obj.object_list)
+    context = {
+        'page_obj': page_obj,
+        'title': 'Популярное сейчас',
+        'feed_generation': feed_generation(),
+    }
+    return render(request, 'posts/trending.html', context)
+
+
+@query_budget(7)
+@condition(etag_func=feed_etag)
 def group_posts(request, slug):
     '''
     Позволяет перенести в HTML-код страницы данной группы постов записи из
@@ -35,9 +79,12 @@ def group_posts(request, slug):
     определённой группе, которая оп-ся, исходя из значения "slug".
     Записей взято - первые 10 штук.
     '''
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    group = get_object_or_404(Group, slug=slug, is_deleted=False)
+    posts = group.posts.visible().select_related(
+        'author', 'group'
+    ).prefetch_related('image_variants')
     page_obj = paginator(request, posts, NUMBER_OF_POSTS)
+    attach_thumbnails(page_obj.object_list)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -45,37 +92,67 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(11)
+@condition(etag_func=profile_etag)
 def profile(request, username):
     '''
     Переводит на страницу с постами конкретного пользователя.
     '''
-    user = User.objects.get(username=username)
-    post_list = user.posts.all()
+    user = get_object_or_404(User, username=username, is_active=True)
+    post_list = user.posts.visible().select_related(
+        'author', 'group'
+    ).prefetch_related('image_variants')
     queryset = Follow.objects.filter(user=request.user.pk,
                                      author=user.pk)
     following = len(queryset) != 0
-    number_post_of_user = post_list.count()
+    stats = get_user_stats(user)
     page_obj = paginator(request, post_list, PAGE_POSTS_OF_USER)
+    attach_thumbnails(page_obj.object_list)
     templates = 'posts/profile.html'
     context = {
-        'number_post_of_user': number_post_of_user,
+        'number_post_of_user': stats.posts_count,
+        'stats': stats,
         'username': user,
         'page_obj': page_obj,
         'following': following,
+        'suggestions': suggestions_for(request.user),
     }
     return render(request, templates, context)
 
 
+@query_budget(5)
+def search(request):
+    '''
+    Полнотекстовый поиск по постам и комментариям. Лучшие совпадения
+    выводятся первыми, вместе со сниппетом найденного текста.
+    '''
+    query = request.GET.get('q', '').strip()
+    results = search_posts(query, NUMBER_OF_POSTS,
+                           after=request.GET.get('after'),
+                           before=request.GET.get('before'))
+    context = {
+        'query': query,
+        'title': 'Поиск',
+        **results,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@query_budget(8)
+@condition(etag_func=feed_etag)
 def post_detail(request, post_id):
     '''
     Переводит на страницу с информацией конкретного поста.
     Если вы являетесь автором данного поста, то вам будет
     доступна кнопка "редактировать запись".
     '''
-    post = Post.objects.get(pk=post_id)
-    number_post_of_user = Post.objects.filter(author=post.author).count()
+    post = get_object_or_404(Post.objects.visible().select_related(
+        'author', 'group'
+    ).prefetch_related('image_variants'), pk=post_id)
+    attach_thumbnails([post])
+    number_post_of_user = get_user_stats(post.author).posts_count
     form = CommentForm()
-    comments = post.comments.all()
+    comments = comments_page(request, post.pk)
 
     templates = 'posts/post_detail.html'
     context = {
@@ -87,19 +164,49 @@ def post_detail(request, post_id):
     return render(request, templates, context)
 
 
+def comments_page(request, post_id):
+    '''
+    Страница комментариев поста в порядке написания, вместе с авторами.
+    Страницы выбираются по курсору (created, id), поэтому и страница
+    поста, и догрузка комментариев стоят одинаково при любом их числе.
+    '''
+    comments = Comment.objects.select_related('author').filter(
+        post_id=post_id, author__is_active=True
+    ).order_by('created', 'pk')
+    return paginator(request, comments, COMMENTS_PER_PAGE,
+                     keys=('created', 'pk'), descending=False)
+
+
+@query_budget(4)
+@condition(etag_func=feed_etag)
+def post_comments(request, post_id):
+    '''
+    Следующая страница комментариев поста (?after=<курсор>) - фрагмент
+    HTML без шапки и подвала, который страница поста подгружает по
+    кнопке "Показать ещё".
+    '''
+    post = get_object_or_404(Post.objects.visible().only('pk'), pk=post_id)
+    context = {
+        'post_id': post.pk,
+        'comments': comments_page(request, post.pk),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
 def post_create(request):
     '''
     Переводит на страницу с формой для создания нового поста.
     '''
-    groups = Group.objects.all()
+    groups = Group.objects.filter(is_deleted=False)
     if request.method == 'POST':
         form = PostForm(request.POST, files=request.FILES or None)
 
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            with transaction.atomic():
+                post.save()
             return redirect('posts:profile', request.user.username)
 
         return render(request, 'posts/create_or_up_post.html',
@@ -116,9 +223,9 @@ def post_edit(request, post_id):
     Переводит на страницу редактирования поста.
     '''
     is_edit = True
-    post = Post.objects.get(pk=post_id)
+    post = get_object_or_404(Post.objects.visible(), pk=post_id)
     id_author = post.author
-    groups = Group.objects.all()
+    groups = Group.objects.filter(is_deleted=False)
     if id_author == request.user:
         if request.method == 'POST':
             form = PostForm(request.POST, files=request.FILES or None,
@@ -142,32 +249,47 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = Post.objects.get(pk=post_id)
+    post = get_object_or_404(Post.objects.visible(), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(6)
 @login_required
 def follow_index(request):
     '''
     Создаёт страницу с постами авторов, на которых сделана подписка.
+    Посты берутся из материализованной ленты TimelineEntry, которую
+    заполняют сигналы при публикации поста и подписке. Отрисованная
+    лента кэшируется по поколению ленты пользователя, и кэш проверяется
+    до запросов к БД.
     '''
-    set = User.objects.filter(following__in=Follow.objects.
-                              filter(user=request.user.pk))
-    post_list = Post.objects.select_related('author',
-                                            'group').filter(author__in=set)
-    page_obj = paginator(request, post_list, NUMBER_OF_POSTS)
     template = 'posts/follow.html'
-    title = 'Избранные авторы'
-    context = {
-        'page_obj': page_obj,
-        'title': title,
-    }
+    context = {'title': 'Избранные авторы'}
+    key = follow_page_key(request)
+    feed = cache.get(key)
+    if feed is None:
+        entries = TimelineEntry.objects.select_related(
+            'post__author', 'post__group'
+        ).prefetch_related('post__image_variants').filter(
+            user=request.user, post__is_deleted=False,
+            post__author__is_active=True,
+        )
+        page_obj = paginator(request, entries, NUMBER_OF_POSTS)
+        page_obj.object_list = [entry.post for entry in page_obj.object_list]
+        attach_thumbnails(page_obj.object_list)
+        context.update(page_obj=page_obj,
+                       suggestions=suggestions_for(request.user))
+        feed = render_to_string('posts/includes/follow_feed.html', context,
+                                request)
+        cache.set(key, feed, settings.FEED_CACHE_TIMEOUT)
+    context['feed'] = feed
     return render(request, template, context)
 
 
@@ -178,7 +300,7 @@ def profile_follow(request, username):
     '''
     if username == request.user.username:
         return redirect('posts:profile', username=username)
-    user = get_object_or_404(User, username=username)
+    user = get_object_or_404(User, username=username, is_active=True)
     Follow.objects.get_or_create(user=request.user, author=user)
     return redirect('posts:profile', username=username)
 
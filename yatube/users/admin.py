@@ -1,2 +1,18 @@
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
 
-# Register your models here.
+from posts.admin import BackgroundDeletionMixin
+
+User = get_user_model()
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class YatubeUserAdmin(BackgroundDeletionMixin, UserAdmin):
+    '''
+    Стандартная админка пользователей, но удаление автора со всеми его
+    постами, комментариями и подписками идёт в фоне.
+    '''
+    pass
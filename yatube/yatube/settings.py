@@ -54,6 +54,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -64,6 +68,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'yatube.urls'
 
+TEST_RUNNER = 'core.testing.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -76,6 +82,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.cache_timeouts.cache_timeouts',
             ],
         },
     },
@@ -91,9 +98,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами (секунды), а не открывается
+        # заново на каждый запрос.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
     }
 }
 
+# Реплики только для чтения (core.routers.PrimaryReplicaRouter). Для
+# небольшой установки реплика - копия файла SQLite, которую обновляет
+# manage.py sync_replica.
+DATABASE_REPLICAS = []
+if os.getenv('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME'),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+# Сколько секунд после записи чтения идут в основную базу.
+REPLICA_STICKY_SECONDS = 5
+REPLICA_STICKY_COOKIE = 'use_primary'
+
+# PRAGMA для каждого нового соединения с SQLite (core.db.configure_sqlite).
+# WAL: читатели не блокируют писателя; synchronous=NORMAL в режиме WAL
+# не теряет целостность, только последние транзакции при сбое питания.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 2 ** 20,
+    # Отрицательное значение - размер кэша страниц в КиБ.
+    'cache_size': -64 * 2 ** 10,
+    'temp_store': 'MEMORY',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -150,10 +189,110 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-
-
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+# Раздавать MEDIA_ROOT самим приложением (core.views.serve_media), если
+# перед ним нет nginx. При DEBUG файлы раздаются всегда.
+MEDIA_SERVE_ENABLED = os.getenv('MEDIA_SERVE_ENABLED', 'False') == 'True'
+MEDIA_SERVE_BLOCK_SIZE = 64 * 2 ** 10
+# Cache-Control: max-age для обычных файлов и для файлов с хэшем
+# содержимого в имени, которые никогда не меняются.
+MEDIA_MAX_AGE = 60 * 60
+MEDIA_HASHED_MAX_AGE = 60 * 60 * 24 * 365
+
+# Миниатюры картинок постов, которые создаются заранее при сохранении
+# поста: имя пресета -> (геометрия, опции sorl-thumbnail).
+THUMBNAIL_PRESETS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
 }
+# Копии картинок постов разной ширины для srcset (WebP и JPEG).
+IMAGE_VARIANT_WIDTHS = (320, 640, 960)
+IMAGE_VARIANT_ASPECT = (960, 339)
+IMAGE_VARIANT_QUALITY = 80
+# Размытое превью картинки, которое встраивается в карточку поста,
+# пока грузится сама картинка: ширина в пикселях и качество JPEG.
+IMAGE_PREVIEW_WIDTH = 20
+IMAGE_PREVIEW_QUALITY = 50
+# Картинка поста, сохранённая меньше стольких секунд назад, не
+# удаляется даже без ссылок на неё: её может сейчас получить новый пост
+# с тем же содержимым. Такие файлы удаляет команда release_images.
+IMAGE_RELEASE_DELAY = 60 * 60
+
+# Загрузка картинок. Файлы больше FILE_UPLOAD_MAX_MEMORY_SIZE пишутся
+# во временный файл на диске, а не держатся в памяти.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2 * 2 ** 20
+UPLOAD_IMAGE_MAX_BYTES = 20 * 2 ** 20
+UPLOAD_IMAGE_MAX_SIDE = 10000
+UPLOAD_IMAGE_MAX_PIXELS = 24_000_000
+UPLOAD_IMAGE_QUALITY = 90
+# Процессы, в которых картинки перекодируются без EXIF, и предел
+# адресного пространства каждого процесса в байтах.
+UPLOAD_IMAGE_WORKERS = int(os.getenv('UPLOAD_IMAGE_WORKERS', 2))
+UPLOAD_IMAGE_WORKER_MEMORY = 512 * 2 ** 20
+# Сколько секунд запрос ждёт перекодирования, прежде чем отклонить
+# картинку.
+UPLOAD_IMAGE_TIMEOUT = 30
+
+
+# Фоновые задачи (рассылка постов по лентам подписчиков, превью и копии
+# картинок и т.п.). Выключать только для отладки: тогда задачи
+# выполняются сразу, внутри запроса. Тесты выключают их сами
+# (core.testing).
+BACKGROUND_TASKS_ENABLED = (
+    os.getenv('BACKGROUND_TASKS_ENABLED', 'True') == 'True'
+)
+BACKGROUND_TASKS_WORKERS = int(os.getenv('BACKGROUND_TASKS_WORKERS', 2))
+
+
+# Бюджет запросов к БД для представлений (core.query_budget). В строгом
+# режиме превышение бюджета - исключение, иначе - запись в лог.
+# В тестах строгий режим включён всегда (core.testing).
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+
+
+# Кэш. CACHE_LOCATION - адреса memcached через запятую (host:port):
+# кэш общий для всех процессов сайта, и новое поколение кэша лент,
+# записанное одним процессом, сразу видят остальные. Без него у каждого
+# процесса свой LocMemCache и чужих сбросов он не видит, поэтому всё,
+# что устаревает по поколениям, живёт не дольше LOCAL_CACHE_TIMEOUT.
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', '')
+if CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': CACHE_LOCATION.split(','),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+LOCAL_CACHE_TIMEOUT = 20
+# Фрагменты лент и карточки постов. В общем кэше они устаревают по
+# поколениям и ключам, а не по времени.
+FEED_CACHE_TIMEOUT = 60 * 60 * 6 if CACHE_LOCATION else LOCAL_CACHE_TIMEOUT
+POST_CARD_CACHE_TIMEOUT = (60 * 60 * 24 if CACHE_LOCATION
+                           else LOCAL_CACHE_TIMEOUT)
+# Счётчики поколений кэша лент и кэш списка групп (None - бессрочно).
+CACHE_GENERATION_TIMEOUT = None if CACHE_LOCATION else LOCAL_CACHE_TIMEOUT
+
+
+# Кэш целых страниц для анонимных посетителей.
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'False') == 'True'
+# Через сколько секунд страница считается устаревшей.
+PAGE_CACHE_TIMEOUT = 60 if CACHE_LOCATION else LOCAL_CACHE_TIMEOUT
+# Сколько ещё секунд устаревшая страница отдаётся, пока её пересчитывают.
+PAGE_CACHE_STALE_TIMEOUT = 60 * 10 if CACHE_LOCATION else 0
+PAGE_CACHE_LOCK_TIMEOUT = 10
+# Сколько секунд запрос ждёт страницу, которую уже отрисовывает другой
+# обработчик, если старой копии нет.
+PAGE_CACHE_WAIT_TIMEOUT = 2
+# Чем больше, тем раньше начинается вероятностный пересчёт.
+PAGE_CACHE_BETA = 1.0
+PAGE_CACHE_VIEWS = (
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:trending',
+)
@@ -13,10 +13,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from core.views import serve_media
 
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
@@ -30,7 +33,13 @@ handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.csrf_failure'
 handler500 = 'core.views.error_500'
 
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
+if settings.DEBUG or settings.MEDIA_SERVE_ENABLED:
+    urlpatterns += [
+        re_path(
+            r'^{}(?P<path>.+)$'.format(
+                re.escape(settings.MEDIA_URL.lstrip('/'))
+            ),
+            serve_media,
+            name='media',
+        ),
+    ]